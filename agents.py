@@ -1,6 +1,19 @@
+import inspect
+import math
+import multiprocessing
 import random
+import struct
+import threading
+import time
 
+from collections import OrderedDict
+
+from model import BIT_CELL
+from model import BitboardUltimateTicTacToe
+from model import CELL_BIT
+from model import INVERSE_SYMMETRY
 from model import Player
+from model import transform_action
 
 ######################
 ### Abstract Agent ###
@@ -8,12 +21,52 @@ from model import Player
 
 class Agent():
 
+    # The SearchStats of the most recent call to getAction, for agents that search.
+    stats = None
+
+    def __init__(self):
+        # Set by stop to end the current search early.
+        self.stop_search = threading.Event()
+
     def getAction(self, state):
         """
         Returns the action that this Agent would like to play in the provided state.
         """
         pass
 
+    def stop(self):
+        """
+        Asks this Agent, from another thread, to end its current call to getAction as soon as 
+        possible, returning the best action it has found so far. Agents that do not search 
+        return as usual. The request stands until stop_search is cleared by the caller, before
+        the agent is next asked for an action.
+        """
+        self.stop_search.set()
+
+    def search_progress(self):
+        """
+        Returns a triple (depth, nodes, seconds) of the progress of the current call to 
+        getAction, as read from another thread: the deepest completed search depth (or None if 
+        the agent does not search by depth), the number of nodes visited, and the time spent, 
+        or None if the agent does not report its progress.
+        """
+        return None
+
+    def observeAction(self, state, action):
+        """
+        Informs this Agent that the provided action was played in the provided state, by either 
+        player. The game loops call it after every move, before the next player is asked for an 
+        action.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases any resources held by this Agent, such as worker processes, once it has 
+        finished playing.
+        """
+        pass
+
 ####################
 ### Random Agent ###
 ####################
@@ -44,97 +97,1529 @@ class HumanAgent(Agent):
         super().__init__()
 
     def getAction(self, state):
+        """
+        Waits for the user to click a legal action in the graphical interface, and returns it, 
+        or None if the interface is closed first.
+        """
         from graphics import get_clicked
-        return get_clicked()
+        actions = state.actions()
+        action = get_clicked()
+        while action is not None and action not in actions:
+            action = get_clicked()
+        return action
+
+###########################
+### Transposition Table ###
+###########################
+
+# The bound types of a transposition table entry.
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class TranspositionTable():
+    """
+    A bounded table of previously searched positions, keyed by Zobrist hash. Each entry is a 
+    tuple (key, depth, value, bound, move, generation). Positions map to a single slot; an 
+    occupied slot is replaced by a new entry for the same position, by an entry from a newer 
+    search, or by an entry searched at least as deeply.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = [None] * size
+        self.generation = 0
+
+    def new_search(self):
+        """
+        Marks the beginning of a new search, so that older entries become replaceable.
+        """
+        self.generation += 1
+
+    def lookup(self, key):
+        """
+        Returns the entry stored for the provided key, or None if there is no such entry.
+        """
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, value, bound, move):
+        """
+        Stores the result of searching a position, subject to the replacement policy.
+        """
+        index = key % self.size
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, value, bound, move, self.generation)
+
+class SharedTranspositionTable():
+    """
+    A transposition table with the same interface and replacement policy as TranspositionTable,
+    stored in shared memory so that it can be used by several processes at once. Each slot holds
+    three 64-bit words: the key XORed with the other two words, the value, and the packed depth,
+    bound, move, and generation. The table is not locked; an entry that is torn by concurrent 
+    writes fails the XOR check and is treated as missing.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.words = multiprocessing.Array('Q', 3 * size, lock=False)
+        self.generation = 0
+
+    def new_search(self):
+        """
+        Marks the beginning of a new search, so that older entries become replaceable.
+        """
+        self.generation += 1
+
+    def lookup(self, key):
+        """
+        Returns the entry stored for the provided key, or None if there is no such entry.
+        """
+        index = 3 * (key % self.size)
+        check, value, data = self.words[index], self.words[index + 1], self.words[index + 2]
+        if data == 0 or check ^ value ^ data != key:
+            return None
+        move = (data >> 16) & 0x7F
+        return (key, data & 0xFF, struct.unpack('<d', struct.pack('<Q', value))[0], (data >> 8) & 0xFF, BIT_CELL[move] if move < 81 else None, data >> 23)
+
+    def store(self, key, depth, value, bound, move):
+        """
+        Stores the result of searching a position, subject to the replacement policy.
+        """
+        index = 3 * (key % self.size)
+        data = self.words[index + 2]
+        if data != 0 and self.words[index] ^ self.words[index + 1] ^ data != key and data >> 23 == self.generation and depth < data & 0xFF:
+            return
+        value = struct.unpack('<Q', struct.pack('<d', value))[0]
+        data = depth | bound << 8 | (CELL_BIT[move[0]][move[1]] if move is not None else 0x7F) << 16 | self.generation << 23
+        self.words[index] = key ^ value ^ data
+        self.words[index + 1] = value
+        self.words[index + 2] = data
+
+#####################
+### Move Ordering ###
+#####################
+
+class MoveOrderer():
+    """
+    Orders the actions of an alpha-beta search so that the actions most likely to cause a cutoff 
+    are searched first. In order of priority, actions are ranked by whether they are the best 
+    action remembered for the position (from the transposition table or a previous iteration), 
+    whether they win their sub-board, whether they are killer moves (actions that recently caused 
+    a cutoff at the same ply), and by their history score (accumulated over all cutoffs they have 
+    caused). Actions that send the opponent to a scored sub-board, and thus give them a free move, 
+    are penalized.
+    """
+
+    FIRST_ACTION_SCORE = 1 << 30
+    SUB_BOARD_WIN_SCORE = 1 << 24
+    KILLER_SCORE = 1 << 20
+    FREE_MOVE_PENALTY = 1 << 20
+
+    def __init__(self):
+        self.killers = []
+        self.history = {Player.X: [[0] * 9 for i in range(9)], Player.O: [[0] * 9 for i in range(9)]}
+
+    def new_search(self):
+        """
+        Forgets the killer moves and ages the history scores before a new search.
+        """
+        self.killers = []
+        for table in self.history.values():
+            for row in table:
+                for c in range(9):
+                    row[c] //= 2
+
+    def order(self, state, actions, ply, first_action):
+        """
+        Returns the provided actions of the state, sorted from most to least promising.
+        """
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        history = self.history[state.to_move()]
+
+        def score(action):
+            value = history[action[0]][action[1]]
+            if action == first_action:
+                value += MoveOrderer.FIRST_ACTION_SCORE
+            if state.wins_sub_board(action):
+                value += MoveOrderer.SUB_BOARD_WIN_SCORE
+            if action in killers:
+                value += MoveOrderer.KILLER_SCORE
+            if state.frees_opponent(action):
+                value -= MoveOrderer.FREE_MOVE_PENALTY
+            return value
+
+        return sorted(actions, key=score, reverse=True)
+
+    def record_cutoff(self, state, action, ply, search_depth):
+        """
+        Records that the action caused a cutoff in the state, at the provided ply and with the 
+        provided remaining search depth.
+        """
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        self.history[state.to_move()][action[0]][action[1]] += search_depth * search_depth
+
+########################
+### Evaluation Cache ###
+########################
+
+class EvaluationCache():
+    """
+    A bounded cache of the values of an evaluation function, keyed by Zobrist hash, that is
+    called in place of the function. When the cache is full, the least recently used value is 
+    evicted. The numbers of calls answered from the cache and by the function are counted in 
+    hits and misses.
+    """
+
+    def __init__(self, evaluation_function, size):
+        self.evaluation_function = evaluation_function
+        self.size = size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state):
+        key = state.zobrist_hash
+        value = self.values.get(key)
+        if value is not None:
+            self.values.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = self.evaluation_function(state)
+        self.values[key] = value
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+        return value
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+#########################
+### Search Statistics ###
+#########################
+
+class SearchStats():
+    """
+    The statistics of the search for one move: the number of nodes visited, of leaves evaluated, 
+    and of terminal states reached, the number of cutoffs at each ply from the root, the number 
+    of transposition table probes and hits, the depth of the deepest completed search, the wall 
+    time in seconds, the principal variation (the line of best play expected by the search, 
+    starting with the chosen move), the score of the chosen move (as a MiniMax utility, from the
+    perspective of Player X), where they are known, the number of evaluations answered and not 
+    answered by the evaluation cache, if there is one, and whether the search continued from a 
+    search made while pondering.
+    """
+
+    def __init__(self, nodes=0, evaluations=0, terminals=0, cutoffs=None, tt_probes=0, tt_hits=0, depth=0, seconds=0.0, pv=None, score=None, eval_cache_hits=0, eval_cache_misses=0, ponder_hit=False):
+        self.nodes = nodes
+        self.evaluations = evaluations
+        self.terminals = terminals
+        self.cutoffs = cutoffs if cutoffs is not None else []
+        self.tt_probes = tt_probes
+        self.tt_hits = tt_hits
+        self.depth = depth
+        self.seconds = seconds
+        self.pv = pv if pv is not None else []
+        self.score = score
+        self.eval_cache_hits = eval_cache_hits
+        self.eval_cache_misses = eval_cache_misses
+        self.ponder_hit = ponder_hit
+
+    @property
+    def tt_hit_rate(self):
+        """
+        The fraction of transposition table probes that found an entry, or None if there were no
+        probes.
+        """
+        return self.tt_hits / self.tt_probes if self.tt_probes > 0 else None
+
+    @property
+    def eval_cache_hit_rate(self):
+        """
+        The fraction of evaluations answered by the evaluation cache, or None if it was not used.
+        """
+        lookups = self.eval_cache_hits + self.eval_cache_misses
+        return self.eval_cache_hits / lookups if lookups > 0 else None
+
+    @property
+    def effective_branching_factor(self):
+        """
+        The branching factor of a uniform tree of the same depth with as many nodes as were 
+        visited, or None if nothing was searched.
+        """
+        return self.nodes ** (1 / self.depth) if self.depth > 0 and self.nodes > 0 else None
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds > 0 else None
+
+    def to_dict(self):
+        """
+        Returns the statistics as a dictionary that can be serialized as JSON.
+        """
+        return {
+            'nodes': self.nodes,
+            'evaluations': self.evaluations,
+            'terminals': self.terminals,
+            'cutoffs': list(self.cutoffs),
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_hit_rate': self.tt_hit_rate,
+            'depth': self.depth,
+            'effective_branching_factor': self.effective_branching_factor,
+            'seconds': self.seconds,
+            'nodes_per_second': self.nodes_per_second,
+            'pv': [list(action) for action in self.pv],
+            'score': self.score,
+            'eval_cache_hits': self.eval_cache_hits,
+            'eval_cache_misses': self.eval_cache_misses,
+            'eval_cache_hit_rate': self.eval_cache_hit_rate,
+            'ponder_hit': self.ponder_hit,
+        }
+
+######################
+### Endgame Solver ###
+######################
+
+# The proven results of a position, from the perspective of the player to move.
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+class EndgameSolver():
+    """
+    Proves whether positions are won, drawn, or lost for the player to move, by searching them to
+    the end of the game with alpha-beta pruning over the results of utility. Proven results are 
+    cached by canonical key in a TranspositionTable of cache_size entries, with the number of 
+    open cells of each position as its depth, and kept across moves, so that a position proven 
+    once is rarely searched again. The solver is used once the number of open cells (see 
+    BitboardUltimateTicTacToe.open_cells) is at most the threshold, and gives up on a position 
+    after visiting node_limit nodes.
+    """
+
+    def __init__(self, threshold, stop_search=None, cache_size=1 << 18, node_limit=200000):
+        self.threshold = threshold
+        self.cache = TranspositionTable(cache_size)
+        self.node_limit = node_limit
+        self.deadline = None
+        self.stop_search = stop_search if stop_search is not None else threading.Event()
+        self.nodes = 0
+        self.terminals = 0
+
+    def applies(self, state):
+        """
+        Determines if the provided state is small enough to be solved.
+        """
+        return state.open_cells() <= self.threshold
+
+    def solve(self, state, deadline=None):
+        """
+        Returns the pair (result, action), where result is the proven result of the provided 
+        bitboard state for the player to move, and action is a move that achieves it. Raises 
+        SearchTimeout if the deadline passes, the node limit is reached, or stop_search is set 
+        first.
+        """
+        # The entries of earlier solves become replaceable, so that the entry of the state itself
+        # is always stored.
+        self.cache.new_search()
+        self.deadline = deadline
+        self.nodes = 0
+        self.terminals = 0
+        state = state.copy()
+        try:
+            result = self.negamax(state, LOSS, WIN)
+        finally:
+            self.deadline = None
+        key, symmetry = state.canonical()
+        return result, transform_action(self.cache.lookup(key)[4], INVERSE_SYMMETRY[symmetry])
+
+    def best_move(self, state):
+        """
+        Returns a move that achieves the proven result of the provided bitboard state, if it is 
+        cached, or None otherwise.
+        """
+        key, symmetry = state.canonical()
+        entry = self.cache.lookup(key)
+        if entry is None or entry[3] != EXACT or entry[4] is None:
+            return None
+        return transform_action(entry[4], INVERSE_SYMMETRY[symmetry])
+
+    def negamax(self, state, alpha, beta):
+        """
+        Computes the result of the provided (non-terminal at the root) state for the player to 
+        move, within the window (alpha, beta).
+        """
+        self.nodes += 1
+
+        if state.is_terminal():
+            self.terminals += 1
+            utility = state.utility()
+            result = WIN if utility > 0 else LOSS if utility < 0 else DRAW
+            return result if state.to_move() == Player.X else -result
+
+        if self.nodes > self.node_limit or self.stop_search.is_set() or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+        alpha_original = alpha
+        key, symmetry = state.canonical()
+        entry = self.cache.lookup(key)
+        first_action = None
+        if entry is not None:
+            if entry[3] == EXACT:
+                return entry[2]
+            elif entry[3] == LOWER_BOUND:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if alpha >= beta:
+                return entry[2]
+            first_action = transform_action(entry[4], INVERSE_SYMMETRY[symmetry])
+
+        # Actions that win their sub-board are tried first, and actions that give the opponent a
+        # free move last.
+        actions = sorted(state.actions(), key=lambda action: (action != first_action, not state.wins_sub_board(action), state.frees_opponent(action)))
+
+        best_value = LOSS - 1
+        best_action = None
+        for action in actions:
+            state.push(action)
+            value = -self.negamax(state, -beta, -alpha)
+            state.pop()
+            if value > best_value:
+                best_value = value
+                best_action = action
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        # Since no result exceeds a win or falls below a loss, a bound at either is a proof.
+        if best_value <= alpha_original and best_value != LOSS:
+            bound = UPPER_BOUND
+        elif best_value >= beta and best_value != WIN:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.cache.store(key, state.open_cells(), best_value, bound, transform_action(best_action, symmetry))
+        return best_value
 
 #####################
 ### MiniMax Agent ###
 #####################
 
+class SearchTimeout(Exception):
+    """
+    Raised within a search when the time allotted to it has run out.
+    """
+    pass
+
 class MiniMaxAgent(Agent):
     """
     A game-playing agent for Ultimate Tic-Tac-Toe that chooses moves according to the 
     MiniMax algorithm (with alpha-beta pruning). The evaluation_function must be specified
     as a string of the name of the desired evaluation function defined in evaluation_functions.py.
+    The search is performed in place on a private bitboard copy of the state, using push and pop.
+    Searched positions are kept in a transposition table of tt_size entries that persists across
+    moves; a tt_size of 0 disables the table. Positions are looked up by their canonical key, so 
+    that symmetric positions share entries. Unless ordering is disabled, actions are searched in 
+    the order given by a MoveOrderer; otherwise, only the best remembered action is searched 
+    first.
+
+    If workers is greater than one, the actions at the root are searched in parallel by a pool 
+    of worker processes, following the Young Brothers Wait Concept: the first action is searched
+    alone to establish a bound, and the remaining actions are then searched concurrently, each 
+    starting from the best bound found so far. If shared_tt is set, the transposition table is 
+    kept in shared memory and used by all workers; otherwise, each worker keeps its own.
+
+    If eval_cache_size is positive, the values of the evaluation function are kept in an 
+    EvaluationCache of that many entries, which persists across moves.
+
+    The counters of the current search are kept in nodes, evaluations, terminals, cutoffs (per 
+    ply), tt_probes and tt_hits, and the statistics of the most recent move in stats.
+
+    If book is the path of an opening book (see opening_book.py), positions found in the book are
+    played from it without searching. Similarly, if database is the path of a position database 
+    (see position_database.py), positions found in it are played from it without searching, 
+    provided that they were analyzed at least as deeply as the agent's depth (if it has no 
+    time_limit). If endgame_threshold is positive, once at most that many open cells remain, the
+    agent solves the position exactly with an EndgameSolver (within half of its time_limit, if it
+    has one, and the solver's node limit), and plays a winning or drawing move if there is one;
+    the solver is disabled by default.
+
+    If ponder is set, the agent keeps searching in a background thread during the opponent's 
+    turn, assuming that the opponent plays the reply expected by its last search. If it does, 
+    the next search continues from the deepest iteration completed while pondering, and the 
+    transposition table keeps everything the pondering search found either way. The background
+    search is stopped when the agent observes the opponent's move (see Agent.observeAction) or 
+    is asked for an action.
     """
 
-    def __init__(self, evaluation_function, depth):
+    def __init__(self, evaluation_function, depth, tt_size=1 << 18, time_limit=None, ordering=True, workers=1, shared_tt=False, book=None, database=None, endgame_threshold=0, eval_cache_size=0, ponder=False):
         super().__init__()
+        if ponder and workers > 1:
+            raise Exception('Agents with worker processes cannot ponder!')
         self.load_evaluation_function(evaluation_function)
+        self.eval_cache_size = eval_cache_size
+        if eval_cache_size > 0:
+            self.evaluation_cache = EvaluationCache(self.evaluation_function, eval_cache_size)
+            self.evaluation_function = self.evaluation_cache
+        else:
+            self.evaluation_cache = None
+        self.evaluation_function_name = evaluation_function
         self.depth = depth
+        self.tt_size = tt_size
+        if tt_size > 0:
+            self.transposition_table = SharedTranspositionTable(tt_size) if shared_tt and workers > 1 else TranspositionTable(tt_size)
+        else:
+            self.transposition_table = None
+        self.time_limit = time_limit
+        self.deadline = None
+        self.ordering = ordering
+        self.move_orderer = MoveOrderer() if ordering else None
+        self.root_depth = 0
+        self.reset_counters()
+        self.workers = workers
+        self.pool = None
+        self.shared_bound = None
+        self.shared_stop = None
+        if book is not None:
+            from opening_book import OpeningBook
+            self.book = OpeningBook.load(book)
+        else:
+            self.book = None
+        if database is not None:
+            from position_database import PositionDatabase
+            self.database = PositionDatabase(database)
+        else:
+            self.database = None
+        self.solver = EndgameSolver(endgame_threshold, self.stop_search) if endgame_threshold > 0 else None
+        self.ponder = ponder
+        self.ponder_thread = None
+        self.ponder_position = None
+        self.ponder_result = None
+        self.search_start = None
+        self.progress_depth = 0
 
     def getAction(self, state):
         """
         Selects the action with maximum MiniMax utility. This action's utility may be
         estimated using this agent's evaluation function, depending on search depth.
+
+        If this agent has a time_limit (in milliseconds), the depth is ignored; instead, the 
+        search is deepened iteratively until the time runs out, and the best action of the 
+        deepest completed iteration is returned.
+        """
+        start = time.perf_counter()
+        root = BitboardUltimateTicTacToe.from_state(state)
+        pondered = self.pondered_search(root)
+        self.begin_search(start)
+        known_action = self.known_move(root, start)
+        if known_action is not None:
+            self.start_pondering(root, known_action)
+            return known_action
+        state = root.copy()
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        if self.move_orderer is not None:
+            self.move_orderer.new_search()
+        self.reset_counters()
+
+        if self.time_limit is None:
+            if pondered is not None and (pondered[2] >= min(self.depth, state.open_cells()) or abs(pondered[1]) == 100):
+                best_action, value, depth = pondered
+            else:
+                try:
+                    best_action, value = self.search_root(state, self.depth, None)
+                    depth = self.depth
+                except SearchTimeout:
+                    # The search was stopped; the best move remembered for the state is played.
+                    best_action = self.tt_move(*root.canonical()) if self.transposition_table is not None else None
+                    best_action = best_action if best_action in root.actions() else root.actions()[0]
+                    value = None
+                    depth = 0
+            self.stats = self.search_stats(root, best_action, depth, start, value)
+            self.stats.ponder_hit = pondered is not None
+            self.start_pondering(root, best_action)
+            return best_action
+
+        best_action, value, completed_depth = pondered if pondered is not None else (None, None, 0)
+        fallback_action = state.actions()[0]
+        self.deadline = start + self.time_limit / 1000
+        try:
+            # There is no use in searching deeper than the number of moves left in the game.
+            best_action, value, completed_depth = self.deepen(state, completed_depth + 1, state.open_cells(), best_action, value)
+        finally:
+            self.deadline = None
+
+        best_action = best_action if best_action is not None else fallback_action
+        self.stats = self.search_stats(root, best_action, completed_depth, start, value)
+        self.stats.ponder_hit = pondered is not None
+        self.start_pondering(root, best_action)
+        return best_action
+
+    def search_iteration(self, state, depth, first_action, previous_score):
+        """
+        Searches the provided state to the provided depth as one iteration of an iteratively 
+        deepened search, given the best action and score of the previous iteration (or None), 
+        returning the best action and its score.
+        """
+        return self.search_root(state, depth, first_action)
+
+    def deepen(self, state, first_depth, max_depth, best_action, score):
+        """
+        Searches the provided state iteratively to every depth from first_depth to max_depth, 
+        starting from the best action and score of a search to the depth before first_depth (or 
+        None), until the game is proven to be won or lost, or the search times out. Returns the 
+        best action and score of the deepest completed iteration, and its depth.
+        """
+        completed_depth = first_depth - 1
+        self.progress_depth = completed_depth
+        try:
+            for depth in range(first_depth, max_depth + 1):
+                if score is not None and abs(score) == 100:
+                    break
+                best_action, score = self.search_iteration(state, depth, best_action, score)
+                completed_depth = depth
+                self.progress_depth = depth
+        except SearchTimeout:
+            # The interrupted search leaves moves pushed onto the state, which is discarded.
+            pass
+        return best_action, score, completed_depth
+
+    def begin_search(self, start):
+        """
+        Resets the progress of the search (see search_progress) that begins at the provided time.
+        """
+        self.search_start = start
+        self.progress_depth = 0
+
+    def search_progress(self):
+        if self.search_start is None:
+            return None
+        return self.progress_depth, self.nodes, time.perf_counter() - self.search_start
+
+    def observeAction(self, state, action):
+        """
+        Stops pondering as soon as the opponent plays a move other than the expected one.
+        """
+        if self.ponder_thread is not None and self.ponder_position is not None:
+            # The exact hash is compared, since the canonical key would also match the symmetric 
+            # images of the state, in which the expected reply is a different move.
+            key = BitboardUltimateTicTacToe.from_state(state).zobrist_hash
+            if key == self.ponder_position[0] and action != self.ponder_position[1]:
+                self.stop_pondering()
+
+    def start_pondering(self, root, best_action):
+        """
+        Starts searching, in a background thread, the state reached from the provided root state 
+        by the best action and the opponent's reply expected by the transposition table, if 
+        pondering is enabled and there is such a reply.
+        """
+        if not self.ponder or self.transposition_table is None:
+            return
+        state = root.copy()
+        state.push(best_action)
+        if state.is_terminal():
+            return
+        reply = self.expected_reply(state)
+        if reply is None or reply not in state.actions():
+            return
+
+        # The pondering agent watches for the opponent's move in the state after its own move.
+        self.ponder_position = (state.zobrist_hash, reply)
+        state.push(reply)
+        if state.is_terminal():
+            return
+        self.ponder_result = None
+        # Pondering has no time limit, but is stopped by moving its deadline into the past (see 
+        # stop_pondering), leaving stop_search to the callers of stop.
+        self.deadline = float('inf')
+        self.ponder_thread = threading.Thread(target=self.ponder_search, args=(state.copy(),), daemon=True)
+        self.ponder_thread.start()
+
+    def expected_reply(self, state):
+        """
+        Returns the opponent's reply expected in the provided state: the best move remembered by 
+        the transposition table or, after a move that was not searched, by the endgame solver, 
+        the opening book, or the position database. Returns None if none of them knows the state.
+        """
+        reply = self.tt_move(*state.canonical())
+        if reply is None and self.solver is not None:
+            reply = self.solver.best_move(state)
+        if reply is None and self.book is not None:
+            reply = self.book.lookup(state)
+        if reply is None and self.database is not None:
+            entry = self.database.lookup(state)
+            reply = entry[0] if entry is not None else None
+        return reply
+
+    def ponder_search(self, state):
+        """
+        Searches the provided state iteratively until it is stopped, or, if this agent has no 
+        time limit, until it has been searched to the agent's depth, and records the result in 
+        ponder_result as a tuple (Zobrist hash, best action, score, depth).
+        """
+        key = state.zobrist_hash
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        if self.move_orderer is not None:
+            self.move_orderer.new_search()
+        self.reset_counters()
+        max_depth = state.open_cells() if self.time_limit is not None else min(self.depth, state.open_cells())
+        best_action, score, depth = self.deepen(state, 1, max_depth, None, None)
+        if depth > 0:
+            self.ponder_result = (key, best_action, score, depth)
+
+    def stop_pondering(self):
+        """
+        Stops the background search, if there is one, and waits for it to finish.
+        """
+        if self.ponder_thread is not None:
+            self.deadline = float('-inf')
+            self.ponder_thread.join()
+            self.ponder_thread = None
+            self.deadline = None
+        self.ponder_position = None
+
+    def pondered_search(self, root):
+        """
+        Stops pondering, and returns the tuple (best action, score, depth) of the search made 
+        while pondering if it searched the provided state, or None otherwise.
+        """
+        self.stop_pondering()
+        result = self.ponder_result
+        self.ponder_result = None
+        # The best action is a move of the pondered state itself, not of its symmetric images.
+        if result is None or result[0] != root.zobrist_hash or result[1] not in root.actions():
+            return None
+        return result[1:]
+
+    def known_move(self, root, start):
+        """
+        Returns the move of the provided state given by the opening book, the position database, 
+        or the endgame solver, in this order, or None if none of them has a move to play.
+        """
+        action = self.book_move(root, start)
+        if action is None:
+            action = self.database_move(root, start)
+        if action is None:
+            action = self.solved_move(root, start)
+        return action
+
+    def book_move(self, root, start):
         """
+        Returns the move recorded for the provided state in the opening book, if there is one, 
+        and records the statistics of playing it.
+        """
+        if self.book is None:
+            return None
+        action = self.book.lookup(root)
+        if action is not None:
+            self.reset_counters()
+            self.stats = SearchStats(seconds=time.perf_counter() - start, pv=[action])
+        return action
+
+    def database_move(self, root, start):
+        """
+        Returns the move recorded for the provided state in the position database, if there is 
+        one (from a search at least as deep as this agent's, if it searches to a fixed depth), and
+        records the statistics of playing it.
+        """
+        if self.database is None:
+            return None
+        entry = self.database.lookup(root)
+        # The depth of an agent with a time limit is not known in advance, so any record is used.
+        if entry is None or (self.time_limit is None and entry[2] < self.depth):
+            return None
+        action, score, depth = entry
+        self.reset_counters()
+        self.stats = SearchStats(depth=depth, seconds=time.perf_counter() - start, pv=[action], score=score)
+        return action
+
+    def solved_move(self, root, start):
+        """
+        Returns a move that wins or draws the provided state, if the state is small enough to be 
+        solved and is not lost, and records the statistics of solving it.
+        """
+        if self.solver is None or not self.solver.applies(root):
+            return None
+        deadline = start + self.time_limit / 2000 if self.time_limit is not None else None
+        try:
+            result, action = self.solver.solve(root, deadline)
+        except SearchTimeout:
+            return None
+
+        # In a lost position every move loses against perfect play, so the move is left to the 
+        # search, which plays the move that looks best against an imperfect opponent.
+        if result == LOSS:
+            return None
+        self.reset_counters()
+        self.nodes = self.solver.nodes
+        self.terminals = self.solver.terminals
+        utility = 100 * result if root.to_move() == Player.X else -100 * result
+        self.stats = SearchStats(nodes=self.nodes, terminals=self.terminals, seconds=time.perf_counter() - start, pv=[action], score=utility)
+        return action
+
+    def reset_counters(self):
+        """
+        Resets the counters of the search statistics.
+        """
+        self.nodes = 0
+        self.evaluations = 0
+        self.terminals = 0
+        self.cutoffs = []
+        self.tt_probes = 0
+        self.tt_hits = 0
+        if self.evaluation_cache is not None:
+            self.evaluation_cache.reset_counters()
+
+    def counters(self):
+        """
+        Returns the counters of the search statistics, as a tuple that can be passed between 
+        processes and added to another agent's counters with add_counters.
+        """
+        eval_cache_hits, eval_cache_misses = self.eval_cache_counters()
+        return (self.nodes, self.evaluations, self.terminals, self.cutoffs, self.tt_probes, self.tt_hits, eval_cache_hits, eval_cache_misses)
+
+    def eval_cache_counters(self):
+        """
+        Returns the pair (hits, misses) of the evaluation cache since the counters were reset.
+        """
+        if self.evaluation_cache is None:
+            return 0, 0
+        return self.evaluation_cache.hits, self.evaluation_cache.misses
+
+    def add_counters(self, counters):
+        """
+        Adds the provided counters (see counters) to the counters of this agent.
+        """
+        nodes, evaluations, terminals, cutoffs, tt_probes, tt_hits, eval_cache_hits, eval_cache_misses = counters
+        self.nodes += nodes
+        self.evaluations += evaluations
+        self.terminals += terminals
+        for ply, count in enumerate(cutoffs):
+            self.count_cutoff(ply, count)
+        self.tt_probes += tt_probes
+        self.tt_hits += tt_hits
+        if self.evaluation_cache is not None:
+            self.evaluation_cache.hits += eval_cache_hits
+            self.evaluation_cache.misses += eval_cache_misses
+
+    def count_cutoff(self, ply, count=1):
+        """
+        Adds the provided number of cutoffs at the provided ply to the counters.
+        """
+        while len(self.cutoffs) <= ply:
+            self.cutoffs.append(0)
+        self.cutoffs[ply] += count
+
+    def search_stats(self, root, best_action, depth, start, score=None):
+        """
+        Returns the SearchStats of the search just completed from the provided root state, in 
+        which the best action was found to have the provided MiniMax utility.
+        """
+        return SearchStats(self.nodes, self.evaluations, self.terminals, list(self.cutoffs), self.tt_probes, self.tt_hits, depth, time.perf_counter() - start, self.principal_line(root, best_action, depth), score, *self.eval_cache_counters())
+
+    def principal_line(self, root, best_action, depth):
+        """
+        Returns the line of best play expected by the search, following the best moves remembered
+        by the transposition table from the root state after the best action, up to the provided 
+        depth.
+        """
+        line = [best_action]
+        state = root.copy()
+        state.push(best_action)
+        while len(line) < depth and not state.is_terminal():
+            action = self.tt_move(*state.canonical())
+            if action is None or action not in state.actions():
+                break
+            line.append(action)
+            state.push(action)
+        return line
+
+    def search_root(self, state, depth, first_action):
+        """
+        Searches the provided state to the provided depth, returning the best action and its 
+        MiniMax utility. The first_action (typically the best action of a shallower search) is 
+        searched first.
+        """
+        if self.workers > 1:
+            return self.parallel_search_root(state, depth, first_action)
+
+        key, symmetry = state.canonical()
+        if first_action is None:
+            first_action = self.tt_move(key, symmetry)
+        self.root_depth = depth
+
         best_action = None
         alpha = float('-inf')
         beta = float('inf')
 
         if state.to_move() == Player.X:
             max_value = float('-inf')
-            for action in state.actions():
-                value = self.min_value(state.result(action), self.depth - 1, alpha, beta)
+            for action in self.ordered_actions(state, first_action, depth):
+                state.push(action)
+                value = self.min_value(state, depth - 1, alpha, beta)
+                state.pop()
                 if value > max_value:
                     best_action = action
                     max_value = value
                 alpha = max(alpha, max_value)
+            self.store(key, symmetry, depth, max_value, EXACT, best_action)
+            return best_action, max_value
         elif state.to_move() == Player.O:
             min_value = float('inf')
-            for action in state.actions():
-                value = self.max_value(state.result(action), self.depth - 1, alpha, beta)
+            for action in self.ordered_actions(state, first_action, depth):
+                state.push(action)
+                value = self.max_value(state, depth - 1, alpha, beta)
+                state.pop()
                 if value < min_value:
                     best_action = action
                     min_value = value
                 beta = min(beta, min_value)
+            self.store(key, symmetry, depth, min_value, EXACT, best_action)
+            return best_action, min_value
         else:
             raise Exception('Invalid board! Neither Player X or Player O is to move!')
 
-        return best_action
-
     def max_value(self, state, search_depth, alpha, beta):
         """
         Computes the maximum MiniMax utility of child states.
         """
+        self.nodes += 1
+
         if state.is_terminal():
+            self.terminals += 1
             return state.utility()
 
         if search_depth == 0:
+            self.evaluations += 1
             return self.evaluation_function(state)
-        
+
+        if self.stop_search.is_set() or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+        alpha_original, beta_original = alpha, beta
+        key, symmetry = state.canonical()
+        entry = self.probe(key)
+        if entry is not None and entry[1] >= search_depth:
+            if entry[3] == EXACT:
+                return entry[2]
+            elif entry[3] == LOWER_BOUND:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if alpha >= beta:
+                return entry[2]
+
         v = float('-inf')
+        best_action = None
 
-        for action in state.actions():
-            v = max(v, self.min_value(state.result(action), search_depth - 1, alpha, beta))
-            if v > beta:
-                return v
+        for action in self.ordered_actions(state, transform_action(entry[4], INVERSE_SYMMETRY[symmetry]) if entry is not None else None, search_depth):
+            state.push(action)
+            value = self.min_value(state, search_depth - 1, alpha, beta)
+            state.pop()
+            if value > v:
+                v = value
+                best_action = action
+            if v >= beta:
+                self.record_cutoff(state, action, search_depth)
+                break
             alpha = max(alpha, v)
 
+        self.store(key, symmetry, search_depth, v, UPPER_BOUND if v <= alpha_original else LOWER_BOUND if v >= beta_original else EXACT, best_action)
         return v
 
     def min_value(self, state, search_depth, alpha, beta):
         """
         Computes the minimum MiniMax utility of child states.
         """
+        self.nodes += 1
+
         if state.is_terminal():
+            self.terminals += 1
             return state.utility()
         
         if search_depth == 0:
+            self.evaluations += 1
             return self.evaluation_function(state)
-        
+
+        if self.stop_search.is_set() or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+        alpha_original, beta_original = alpha, beta
+        key, symmetry = state.canonical()
+        entry = self.probe(key)
+        if entry is not None and entry[1] >= search_depth:
+            if entry[3] == EXACT:
+                return entry[2]
+            elif entry[3] == LOWER_BOUND:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if alpha >= beta:
+                return entry[2]
+
         v = float('inf')
+        best_action = None
 
-        for action in state.actions():
-            v = min(v, self.max_value(state.result(action), search_depth - 1, alpha, beta))
-            if v < alpha:
-                return v
+        for action in self.ordered_actions(state, transform_action(entry[4], INVERSE_SYMMETRY[symmetry]) if entry is not None else None, search_depth):
+            state.push(action)
+            value = self.max_value(state, search_depth - 1, alpha, beta)
+            state.pop()
+            if value < v:
+                v = value
+                best_action = action
+            if v <= alpha:
+                self.record_cutoff(state, action, search_depth)
+                break
             beta = min(beta, v)
-        
+
+        self.store(key, symmetry, search_depth, v, UPPER_BOUND if v <= alpha_original else LOWER_BOUND if v >= beta_original else EXACT, best_action)
         return v
-    
+
+    def parallel_search_root(self, state, depth, first_action):
+        """
+        Searches the provided state to the provided depth with the pool of worker processes, 
+        returning the best action and its MiniMax utility.
+        """
+        key, symmetry = state.canonical()
+        if first_action is None:
+            first_action = self.tt_move(key, symmetry)
+        self.root_depth = depth
+        maximizing = state.to_move() == Player.X
+        actions = self.ordered_actions(state, first_action, depth)
+
+        # The eldest brother is searched alone to establish a bound for the others.
+        state.push(actions[0])
+        if maximizing:
+            best_value = self.min_value(state, depth - 1, float('-inf'), float('inf'))
+        else:
+            best_value = self.max_value(state, depth - 1, float('-inf'), float('inf'))
+        state.pop()
+        best_action = actions[0]
+
+        pool = self.get_pool()
+        self.shared_bound.value = best_value
+        # The workers follow the stop requests of this agent (see stop), including those made 
+        # before this search.
+        self.shared_stop.clear()
+        if self.stop_search.is_set():
+            self.shared_stop.set()
+        time_remaining = self.deadline - time.perf_counter() if self.deadline is not None else None
+        generation = self.transposition_table.generation if self.transposition_table is not None else 0
+        tasks = [(state, action, depth, generation, time_remaining) for action in actions[1:]]
+
+        # A worker that starts from a bound published by another worker only proves that a worse 
+        # action is no better than the bound, so such results are never chosen; an action that 
+        # ties with the best one may thus be chosen over an earlier one, unlike a serial search.
+        timed_out = False
+        for action, value, bound, counters in pool.imap(_search_root_action, tasks):
+            self.add_counters(counters)
+            if value is None:
+                # The remaining tasks are stopped and drained, so that they do not delay the 
+                # searches that follow.
+                timed_out = True
+                self.shared_stop.set()
+                continue
+            failed_low = value <= bound if maximizing else value >= bound
+            if not failed_low and ((maximizing and value > best_value) or (not maximizing and value < best_value)):
+                best_action = action
+                best_value = value
+        if timed_out:
+            raise SearchTimeout()
+
+        self.store(key, symmetry, depth, best_value, EXACT, best_action)
+        return best_action, best_value
+
+    def stop(self):
+        super().stop()
+        if self.shared_stop is not None:
+            self.shared_stop.set()
+
+    def close(self):
+        self.stop_pondering()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+
+    def get_pool(self):
+        """
+        Returns the pool of worker processes, starting it if necessary.
+        """
+        if self.pool is None:
+            self.shared_bound = multiprocessing.Value('d', 0)
+            self.shared_stop = SharedStopFlag()
+            shared_table = self.transposition_table if isinstance(self.transposition_table, SharedTranspositionTable) else None
+            self.pool = multiprocessing.Pool(self.workers, initializer=_initialize_worker, initargs=(self.evaluation_function_name, self.tt_size, self.ordering, self.eval_cache_size, shared_table, self.shared_bound, self.shared_stop))
+        return self.pool
+
+    def ordered_actions(self, state, first_action, search_depth):
+        """
+        Returns the legal actions in the provided state in the order they should be searched, 
+        with first_action (typically the best move remembered by the transposition table) 
+        searched first.
+        """
+        actions = state.actions()
+        if self.move_orderer is not None:
+            return self.move_orderer.order(state, actions, self.root_depth - search_depth, first_action)
+        if first_action is not None and first_action in actions:
+            actions.remove(first_action)
+            actions.insert(0, first_action)
+        return actions
+
+    def probe(self, key):
+        """
+        Returns the transposition table entry for the provided canonical key, if there is a table
+        and it holds one, counting the probe.
+        """
+        if self.transposition_table is None:
+            return None
+        self.tt_probes += 1
+        entry = self.transposition_table.lookup(key)
+        if entry is not None:
+            self.tt_hits += 1
+        return entry
+
+    def record_cutoff(self, state, action, search_depth):
+        """
+        Counts a cutoff caused by the action in the state, and records it with the MoveOrderer.
+        """
+        ply = self.root_depth - search_depth
+        self.count_cutoff(ply)
+        if self.move_orderer is not None:
+            self.move_orderer.record_cutoff(state, action, ply, search_depth)
+
+    def tt_move(self, key, symmetry):
+        """
+        Returns the best move remembered for the state with the provided canonical key and 
+        symmetry, if any.
+        """
+        if self.transposition_table is None:
+            return None
+        entry = self.transposition_table.lookup(key)
+        return transform_action(entry[4], INVERSE_SYMMETRY[symmetry]) if entry is not None else None
+
+    def store(self, key, symmetry, search_depth, value, bound, best_action):
+        """
+        Records a search result in the transposition table, if there is one. The best action is 
+        stored relative to the canonical image of the state.
+        """
+        if self.transposition_table is not None:
+            self.transposition_table.store(key, search_depth, value, bound, transform_action(best_action, symmetry))
+
     def load_evaluation_function(self, evaluation):
+        """
+        Loads the evaluation function of the provided name. Only the functions of a single state 
+        defined in evaluation_functions.py can be chosen, not its helpers or imported names.
+        """
         module = __import__('evaluation_functions')
-        if not evaluation in dir(module):
+        function = getattr(module, evaluation, None) if not evaluation.startswith('_') else None
+        if not callable(function) or getattr(function, '__module__', None) != module.__name__ or len(inspect.signature(function).parameters) != 1:
             raise Exception('The ' + evaluation + ' function is not defined!')
-        self.evaluation_function = getattr(module, evaluation)
+        self.evaluation_function = function
+
+#######################
+### Parallel Search ###
+#######################
+
+# The agent and shared bound of a worker process of a parallel MiniMaxAgent.
+_worker_agent = None
+_worker_bound = None
+
+class SharedStopFlag():
+    """
+    A flag in shared memory with the interface of threading.Event that the workers of a parallel
+    MiniMaxAgent use as their stop_search, so that the agent can stop the searches of its 
+    workers. It is only set and cleared by the agent.
+    """
+
+    def __init__(self):
+        self.flag = multiprocessing.RawValue('b', 0)
+
+    def is_set(self):
+        return self.flag.value != 0
+
+    def set(self):
+        self.flag.value = 1
+
+    def clear(self):
+        self.flag.value = 0
+
+def _initialize_worker(evaluation_function, tt_size, ordering, eval_cache_size, shared_table, shared_bound, shared_stop):
+    """
+    Initializes a worker process of a parallel MiniMaxAgent.
+    """
+    global _worker_agent, _worker_bound
+    _worker_agent = MiniMaxAgent(evaluation_function, 0, tt_size=0 if shared_table is not None else tt_size, ordering=ordering, eval_cache_size=eval_cache_size)
+    if shared_table is not None:
+        _worker_agent.transposition_table = shared_table
+    _worker_agent.stop_search = shared_stop
+    _worker_bound = shared_bound
+
+def _search_root_action(task):
+    """
+    Searches the result of one root action within a worker process, starting from the best bound
+    found so far by any worker, and shares the result if it improves that bound. Returns the 
+    action, its MiniMax utility (or None if the time ran out or the search was stopped), the 
+    bound that the search started from, and the counters of the search statistics.
+    """
+    state, action, depth, generation, time_remaining = task
+    agent = _worker_agent
+    if agent.transposition_table is not None:
+        agent.transposition_table.generation = generation
+    agent.root_depth = depth
+    agent.reset_counters()
+    agent.deadline = time.perf_counter() + time_remaining if time_remaining is not None else None
+    maximizing = state.to_move() == Player.X
+
+    bound = _worker_bound.value
+    state.push(action)
+    try:
+        if maximizing:
+            value = agent.min_value(state, depth - 1, bound, float('inf'))
+        else:
+            value = agent.max_value(state, depth - 1, float('-inf'), bound)
+    except SearchTimeout:
+        return action, None, bound, agent.counters()
+
+    with _worker_bound.get_lock():
+        if (maximizing and value > _worker_bound.value) or (not maximizing and value < _worker_bound.value):
+            _worker_bound.value = value
+    return action, value, bound, agent.counters()
+
+#################
+### PVS Agent ###
+#################
+
+class PVSAgent(MiniMaxAgent):
+    """
+    A game-playing agent for Ultimate Tic-Tac-Toe that chooses moves according to principal 
+    variation search, a negamax formulation of alpha-beta pruning in which every action after the
+    first is searched with a null window, and only re-searched with the full window if it proves
+    to be better. The search is deepened iteratively, and each iteration is searched with an 
+    aspiration window around the score of the previous one. The evaluation_function is shared 
+    with MiniMaxAgent; its sign is flipped when Player O is to move. Options are as for 
+    MiniMaxAgent, except that the search always runs in a single process.
+    """
+
+    # The width of the null windows, which must be smaller than any meaningful difference between
+    # evaluations, and the initial half-width of the aspiration windows.
+    NULL_WINDOW = 1e-6
+    ASPIRATION_WINDOW = 1
+
+    def getAction(self, state):
+        """
+        Selects the action with maximum negamax utility, searching to this agent's depth, or for 
+        as long as its time_limit (in milliseconds) allows.
+        """
+        start = time.perf_counter()
+        root = BitboardUltimateTicTacToe.from_state(state)
+        pondered = self.pondered_search(root)
+        self.begin_search(start)
+        known_action = self.known_move(root, start)
+        if known_action is not None:
+            self.start_pondering(root, known_action)
+            return known_action
+        state = root.copy()
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        if self.move_orderer is not None:
+            self.move_orderer.new_search()
+        self.reset_counters()
+
+        # There is no use in searching deeper than the number of moves left in the game.
+        max_depth = state.open_cells()
+        if self.time_limit is None:
+            max_depth = min(self.depth, max_depth)
+        else:
+            self.deadline = start + self.time_limit / 1000
+
+        # A search made while pondering is continued from the depth that it completed.
+        best_action, score, completed_depth = pondered if pondered is not None else (None, None, 0)
+        fallback_action = state.actions()[0]
+        try:
+            best_action, score, completed_depth = self.deepen(state, completed_depth + 1, max_depth, best_action, score)
+        finally:
+            self.deadline = None
+
+        best_action = best_action if best_action is not None else fallback_action
+        if score is not None and root.to_move() == Player.O:
+            score = -score
+        self.stats = self.search_stats(root, best_action, completed_depth, start, score)
+        self.stats.ponder_hit = pondered is not None
+        self.start_pondering(root, best_action)
+        return best_action
+
+    def search_iteration(self, state, depth, first_action, previous_score):
+        return self.aspiration_search(state, depth, first_action, previous_score)
+
+    def aspiration_search(self, state, depth, first_action, previous_score):
+        """
+        Searches the provided state to the provided depth within a window around the score of the
+        previous iteration, widening the window whenever the score falls outside of it. Returns 
+        the best action and its negamax utility.
+        """
+        if previous_score is None:
+            return self.search_root(state, depth, first_action, float('-inf'), float('inf'))
+
+        alpha = previous_score - PVSAgent.ASPIRATION_WINDOW
+        beta = previous_score + PVSAgent.ASPIRATION_WINDOW
+        while True:
+            action, score = self.search_root(state, depth, first_action, alpha, beta)
+            if score <= alpha:
+                alpha = float('-inf')
+            elif score >= beta:
+                beta = float('inf')
+                first_action = action
+            else:
+                return action, score
+
+    def search_root(self, state, depth, first_action, alpha, beta):
+        """
+        Searches the provided state to the provided depth within the window (alpha, beta), 
+        returning the best action and its negamax utility. The first_action (typically the best 
+        action of a shallower search) is searched first.
+        """
+        key, symmetry = state.canonical()
+        if first_action is None:
+            first_action = self.tt_move(key, symmetry)
+        self.root_depth = depth
+
+        alpha_original = alpha
+        best_action = None
+        best_value = float('-inf')
+
+        for i, action in enumerate(self.ordered_actions(state, first_action, depth)):
+            state.push(action)
+            value = self.principal_variation(state, i, depth - 1, alpha, beta)
+            state.pop()
+            if value > best_value:
+                best_value = value
+                best_action = action
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        self.store(key, symmetry, depth, best_value, UPPER_BOUND if best_value <= alpha_original else LOWER_BOUND if best_value >= beta else EXACT, best_action)
+        return best_action, best_value
+
+    def principal_variation(self, child, index, search_depth, alpha, beta):
+        """
+        Computes the negamax utility of the child state, from the perspective of its parent, 
+        given the index at which it was searched. Every child after the first is searched with a 
+        null window, and only re-searched with the full window if it beats alpha.
+        """
+        if index == 0:
+            return -self.negamax(child, search_depth, -beta, -alpha)
+        value = -self.negamax(child, search_depth, -alpha - PVSAgent.NULL_WINDOW, -alpha)
+        if alpha < value < beta:
+            value = -self.negamax(child, search_depth, -beta, -alpha)
+        return value
+
+    def negamax(self, state, search_depth, alpha, beta):
+        """
+        Computes the negamax utility of the provided state, from the perspective of the player to
+        move, within the window (alpha, beta).
+        """
+        self.nodes += 1
+
+        if state.is_terminal():
+            self.terminals += 1
+            return state.utility() if state.to_move() == Player.X else -state.utility()
+
+        if search_depth == 0:
+            self.evaluations += 1
+            return self.evaluation_function(state) if state.to_move() == Player.X else -self.evaluation_function(state)
+
+        if self.stop_search.is_set() or (self.deadline is not None and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+        alpha_original = alpha
+        key, symmetry = state.canonical()
+        entry = self.probe(key)
+        if entry is not None and entry[1] >= search_depth:
+            if entry[3] == EXACT:
+                return entry[2]
+            elif entry[3] == LOWER_BOUND:
+                alpha = max(alpha, entry[2])
+            else:
+                beta = min(beta, entry[2])
+            if alpha >= beta:
+                return entry[2]
+
+        best_value = float('-inf')
+        best_action = None
+
+        for i, action in enumerate(self.ordered_actions(state, transform_action(entry[4], INVERSE_SYMMETRY[symmetry]) if entry is not None else None, search_depth)):
+            state.push(action)
+            value = self.principal_variation(state, i, search_depth - 1, alpha, beta)
+            state.pop()
+            if value > best_value:
+                best_value = value
+                best_action = action
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.record_cutoff(state, action, search_depth)
+                break
+
+        self.store(key, symmetry, search_depth, best_value, UPPER_BOUND if best_value <= alpha_original else LOWER_BOUND if best_value >= beta else EXACT, best_action)
+        return best_value
+
+##################
+### MCTS Agent ###
+##################
+
+class MCTSNode():
+    """
+    A node of a Monte Carlo search tree. The wins of a node are counted from the perspective of 
+    the player who executed its action; a draw counts as half a win.
+    """
+
+    __slots__ = ('action', 'parent', 'children', 'untried_actions', 'visits', 'wins')
+
+    def __init__(self, action, parent, state):
+        self.action = action
+        self.parent = parent
+        self.children = []
+        self.untried_actions = [] if state.is_terminal() else state.actions()
+        self.visits = 0
+        self.wins = 0
+
+class MCTSAgent(Agent):
+    """
+    A game-playing agent for Ultimate Tic-Tac-Toe that chooses moves according to Monte Carlo 
+    tree search, selecting nodes by UCT (upper confidence bounds applied to trees) and estimating
+    them with random playouts. Each move runs the given number of iterations or, if the agent has
+    a time_limit (in milliseconds), as many iterations as the time allows. The subtree of the 
+    opponent's reply is kept between moves. In the statistics of a move, every iteration counts
+    as a node and, unless it reached a terminal state, as an evaluation by a playout.
+    """
+
+    def __init__(self, seed, iterations=1000, time_limit=None, exploration=1.4):
+        super().__init__()
+        self.rand = random.Random(seed)
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.root = None
+        self.root_state = None
+        self.terminals = 0
+        self.completed_iterations = 0
+        self.search_start = None
+
+    def getAction(self, state):
+        start = time.perf_counter()
+        state = BitboardUltimateTicTacToe.from_state(state)
+        self.root = self.find_root(state)
+        self.root_state = state
+        self.terminals = 0
+        self.search_start = start
+        self.completed_iterations = 0
+
+        deadline = start + self.time_limit / 1000 if self.time_limit is not None else None
+        # A search that is stopped, out of time, or given no iterations still expands the root, 
+        # so that there is an action to play.
+        while not (self.stop_search.is_set() and self.root.children):
+            if self.root.children and deadline is None and self.completed_iterations >= self.iterations:
+                break
+            if self.root.children and deadline is not None and time.perf_counter() >= deadline:
+                break
+            self.iterate()
+            self.completed_iterations += 1
+        iterations = self.completed_iterations
+        self.stats = SearchStats(nodes=iterations, evaluations=iterations - self.terminals, terminals=self.terminals, seconds=time.perf_counter() - start, pv=self.principal_line())
+
+        # Play the most visited action, and keep its subtree for the next move.
+        best = max(self.root.children, key=lambda child: child.visits)
+        self.root = best
+        self.root_state = state.result(best.action)
+        self.root.parent = None
+        return best.action
+
+    def search_progress(self):
+        if self.search_start is None:
+            return None
+        return None, self.completed_iterations, time.perf_counter() - self.search_start
+
+    def principal_line(self):
+        """
+        Returns the line of most visited actions from the root of the search tree.
+        """
+        line = []
+        node = self.root
+        while node.children:
+            node = max(node.children, key=lambda child: child.visits)
+            line.append(node.action)
+        return line
+
+    def find_root(self, state):
+        """
+        Returns the node of the current search tree that represents the provided state, or a new 
+        tree if there is no such node.
+        """
+        if self.root is not None:
+            for child in self.root.children:
+                if child.action == state.previous_move and self.root_state.result(child.action).zobrist_hash == state.zobrist_hash:
+                    child.parent = None
+                    return child
+        return MCTSNode(None, None, state)
+
+    def iterate(self):
+        """
+        Runs one iteration of selection, expansion, simulation, and backpropagation.
+        """
+        node = self.root
+        state = self.root_state.copy()
+
+        # Selection
+        while not node.untried_actions and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.wins / child.visits + self.exploration * math.sqrt(log_visits / child.visits))
+            state.push(node.action)
+
+        # Expansion
+        if node.untried_actions:
+            action = node.untried_actions.pop(self.rand.randrange(len(node.untried_actions)))
+            state.push(action)
+            child = MCTSNode(action, node, state)
+            node.children.append(child)
+            node = child
+
+        # Simulation
+        player = state.to_move().get_opponent()
+        if state.is_terminal():
+            self.terminals += 1
+        utility = self.playout(state)
+
+        # Backpropagation, alternating between the perspectives of both players.
+        reward = 0.5 if utility == 0 else 1 if (utility > 0) == (player == Player.X) else 0
+        while node is not None:
+            node.visits += 1
+            node.wins += reward
+            reward = 1 - reward
+            node = node.parent
+
+    def playout(self, state):
+        """
+        Plays random moves in place on the provided state until the game ends, returning its 
+        utility.
+        """
+        choice = self.rand.choice
+        push = state.push
+        while not state.is_terminal():
+            push(choice(state.actions()))
+        return state.utility()
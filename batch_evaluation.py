@@ -0,0 +1,157 @@
+import math
+
+import numpy as np
+
+from evaluation_functions import LEARNED_LINE_WEIGHTS
+from evaluation_functions import LEARNED_REGION_WEIGHTS
+from evaluation_functions import LEARNED_WEIGHT_SCALE
+from evaluation_functions import LINE_CLASSES
+from model import Player
+
+#########################
+### Position Encoding ###
+#########################
+
+# The codes of the cells of a board array and of a sub-board score array. Pieces are coded by the
+# values of their players; the cat, whose value is also 0, is given a code of its own so that
+# tied sub-boards are distinguished from unscored ones.
+EMPTY = 0
+X = Player.X.value
+O = Player.O.value
+CAT = 2
+
+def encode_states(states):
+    """
+    Encodes a sequence of game states as a pair (boards, sub_board_scores) of arrays, where
+    boards[i] is the (81,) int8 array of the cells of state i in row-major order, and
+    sub_board_scores[i] is the (9,) int8 array of its sub-board scores in row-major order.
+    """
+    boards = np.zeros((len(states), 81), dtype=np.int8)
+    sub_board_scores = np.zeros((len(states), 9), dtype=np.int8)
+    for i, state in enumerate(states):
+        board = state.board
+        for r in range(9):
+            for c in range(9):
+                if board[r][c] is not None:
+                    boards[i, r * 9 + c] = board[r][c].value
+        for k in range(9):
+            piece = state.sub_board_score[k // 3][k % 3]
+            if piece is not None:
+                sub_board_scores[i, k] = CAT if piece is Player.C else piece.value
+    return boards, sub_board_scores
+
+#########################
+### Line Index Arrays ###
+#########################
+
+# The eight lines of a 3x3 region, as triples of cells in row-major order.
+_LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]
+
+# BIG_BOARD_LINES[j] holds the indices into a sub-board score array of the cells of line j.
+BIG_BOARD_LINES = np.array(_LINES, dtype=np.intp)
+
+# SUB_BOARD_LINES[8 * k + j] holds the indices into a board array of the cells of line j of
+# sub-board k.
+SUB_BOARD_LINES = np.array([[((k // 3) * 3 + l // 3) * 9 + (k % 3) * 3 + l % 3 for l in line] for k in range(9) for line in _LINES], dtype=np.intp)
+
+# SUB_BOARD_LINE_MATRIX[cell, j] is 1 if the cell lies on line j of SUB_BOARD_LINES, and 0 
+# otherwise. Multiplying boards by it sums all 72 lines at once, about twice as fast as gathering 
+# the cells of each line; the sums are small integers, so they are exact in single precision.
+SUB_BOARD_LINE_MATRIX = np.zeros((81, len(SUB_BOARD_LINES)), dtype=np.float32)
+SUB_BOARD_LINE_MATRIX[SUB_BOARD_LINES, np.arange(len(SUB_BOARD_LINES))[:, None]] = 1
+
+# The weights of cell_weight_evaluation: the number of wins each sub-board contributes to.
+CELL_WEIGHTS = np.array([3, 2, 3, 2, 4, 2, 3, 2, 3], dtype=np.int64)
+
+# SUB_BOARD_CELLS[k] holds the indices into a board array of the cells of sub-board k.
+SUB_BOARD_CELLS = np.array([[((k // 3) * 3 + l // 3) * 9 + (k % 3) * 3 + l % 3 for l in range(9)] for k in range(9)], dtype=np.intp)
+
+# The weights of learned_evaluation, as arrays.
+LEARNED_REGION_WEIGHT_ARRAY = np.array(LEARNED_REGION_WEIGHTS)
+LEARNED_LINE_WEIGHT_ARRAY = np.array(LEARNED_LINE_WEIGHTS)[LINE_CLASSES]
+
+########################
+### Helper Functions ###
+########################
+
+def streaks(line_sums, size):
+    """
+    Counts, for each row of the provided (N, L) array of line sums, the lines that sum to 'size'
+    minus the lines that sum to '-size', matching evaluation_functions.streaks.
+    """
+    return np.count_nonzero(line_sums == size, axis=1) - np.count_nonzero(line_sums == -size, axis=1)
+
+def big_board_line_sums(sub_board_scores):
+    """
+    Returns the (N, 8) array of the line sums of the large boards. Lines that contain a sub-board
+    won by the cat can hold no streak, so they are given a sum of 0.
+    """
+    sub_board_scores = np.asarray(sub_board_scores)
+    cells = sub_board_scores[:, BIG_BOARD_LINES]
+    sums = np.where(cells == CAT, 0, cells).sum(axis=2, dtype=np.int64)
+    return np.where((cells == CAT).any(axis=2), 0, sums)
+
+def sub_board_line_sums(boards):
+    """
+    Returns the (N, 72) array of the line sums of all sub-boards.
+    """
+    return np.asarray(boards, dtype=np.float32) @ SUB_BOARD_LINE_MATRIX
+
+def piece_values(sub_board_scores):
+    """
+    Returns the (N, 9) array of the values of the sub-board scores, where the cat is valued 0.
+    """
+    sub_board_scores = np.asarray(sub_board_scores, dtype=np.int64)
+    return np.where(sub_board_scores == CAT, 0, sub_board_scores)
+
+############################
+### Evaluation Functions ###
+############################
+
+# Each function evaluates N positions at once, given their (N, 81) board array and (N, 9)
+# sub-board score array (see encode_states), and returns an (N,) array whose entries equal the
+# values of the function of the same name in evaluation_functions.
+
+def count_wins(boards, sub_board_scores):
+    return piece_values(sub_board_scores).sum(axis=1)
+
+def cell_weight_evaluation(boards, sub_board_scores):
+    return piece_values(sub_board_scores) @ CELL_WEIGHTS
+
+def near_wins(boards, sub_board_scores):
+    return 16 * streaks(big_board_line_sums(sub_board_scores), 2)
+
+def nested_near_wins(boards, sub_board_scores):
+    # The sub-board terms are summed before they are weighted, as by the scalar function.
+    return near_wins(boards, sub_board_scores) + streaks(sub_board_line_sums(boards), 2) * 0.16
+
+def shallow_simple_evaluation(boards, sub_board_scores):
+    sums = big_board_line_sums(sub_board_scores)
+    return 10 * streaks(sums, 2) + streaks(sums, 1)
+
+def deep_simple_evaluation(boards, sub_board_scores):
+    sums = sub_board_line_sums(boards)
+    scores = shallow_simple_evaluation(boards, sub_board_scores) + (streaks(sums, 2) + streaks(sums, 1)) * 0.16
+    if (scores >= 100).any():
+        raise Exception('Evaluation exceeded 100!')
+    return scores
+
+def learned_evaluation(boards, sub_board_scores):
+    boards = np.asarray(boards)
+    region_digits = np.where(boards == O, 2, boards)[:, SUB_BOARD_CELLS]
+    region_weights = LEARNED_REGION_WEIGHT_ARRAY[region_digits @ 3 ** np.arange(9)]
+    digits = np.choose(np.asarray(sub_board_scores) + 1, [2, 0, 1, 3])[:, BIG_BOARD_LINES]
+    line_weights = LEARNED_LINE_WEIGHT_ARRAY[np.arange(len(BIG_BOARD_LINES)), digits @ 4 ** np.arange(3)]
+    # The integer sums are exact; math.tanh is applied rather than np.tanh, whose results may 
+    # differ from it in the last bit.
+    sums = region_weights.sum(axis=1) + line_weights.sum(axis=1)
+    return np.array([99 * math.tanh(total / LEARNED_WEIGHT_SCALE) for total in sums.tolist()])
+
+def zero(boards, sub_board_scores):
+    return np.zeros(len(boards), dtype=np.int64)
+
+def evaluate_states(evaluation_function_name, states):
+    """
+    Evaluates a sequence of game states with the batched version of the named evaluation function.
+    """
+    return globals()[evaluation_function_name](*encode_states(states))
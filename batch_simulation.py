@@ -0,0 +1,183 @@
+import optparse
+import sys
+import time
+
+import numpy as np
+
+from batch_evaluation import CAT
+from model import BIT_CELL
+from model import BitboardUltimateTicTacToe
+from model import CELL_BIT
+from model import FIRST_ACTIONS
+from model import FREE_TARGET
+from model import Player
+from model import WINS
+from model import WINS_THROUGH
+
+#########################
+### Batch Game Arrays ###
+#########################
+
+# The games of a batch are played in lockstep, so every game has the same player to move. Each
+# game is held as a row of a (N, 81) int8 array of cells, laid out by sub-board like the bits of
+# BitboardUltimateTicTacToe (cell l of sub-board k is column 9 * k + l) and coded as in
+# batch_evaluation, and a row of a (N, 9) int8 array of sub-board scores.
+
+# WINS_TABLE[mask] is True if the 9-bit mask of a region contains a line.
+WINS_TABLE = np.array(WINS, dtype=bool)
+# WINS_THROUGH_TABLE[k, mask] is True if the 9-bit mask contains a line through cell k.
+WINS_THROUGH_TABLE = np.array(WINS_THROUGH, dtype=bool)
+
+# The value of each cell of a region as a bit of its 9-bit mask.
+REGION_BITS = 1 << np.arange(9)
+
+# FIRST_ACTION_CELLS lists the columns of the legal first moves.
+FIRST_ACTION_CELLS = np.array([CELL_BIT[r][c] for r, c in FIRST_ACTIONS])
+
+# ROW_MAJOR_CELLS[b] is the row-major index r * 9 + c of the cell in column b.
+ROW_MAJOR_CELLS = np.array([r * 9 + c for r, c in BIT_CELL])
+
+def encode_state(state, num_games):
+    """
+    Encodes num_games copies of the provided game state as a tuple (cells, sub_board_scores,
+    targets), where targets holds the sub-board that each game is forced to play in, or
+    FREE_TARGET.
+    """
+    cells = np.zeros((num_games, 81), dtype=np.int8)
+    sub_board_scores = np.zeros((num_games, 9), dtype=np.int8)
+    for r in range(9):
+        for c in range(9):
+            if state.board[r][c] is not None:
+                cells[:, CELL_BIT[r][c]] = state.board[r][c].value
+    for k in range(9):
+        piece = state.sub_board_score[k // 3][k % 3]
+        if piece is not None:
+            sub_board_scores[:, k] = CAT if piece is Player.C else piece.value
+
+    target = FREE_TARGET
+    if state.previous_move is not None:
+        target = (state.previous_move[0] % 3) * 3 + state.previous_move[1] % 3
+        if sub_board_scores[0, target] != 0:
+            target = FREE_TARGET
+    return cells, sub_board_scores, np.full(num_games, target)
+
+def legal_move_masks(cells, sub_board_scores, targets):
+    """
+    Returns the (N, 81) boolean array of the legal moves of each game: the empty cells of its
+    forced sub-board or, if it is free to play anywhere, the empty cells of all unscored
+    sub-boards.
+    """
+    sub_boards = np.arange(9)
+    playable = np.where((targets == FREE_TARGET)[:, None], sub_board_scores == 0, sub_boards == targets[:, None])
+    return (cells == 0) & np.repeat(playable, 9, axis=1)
+
+def region_masks(regions, value):
+    """
+    Returns the 9-bit masks of the cells of the provided (N, 9) regions that equal the value.
+    """
+    return (regions == value) @ REGION_BITS
+
+#############################
+### Batch Random Playouts ###
+#############################
+
+def simulate_random_games(num_games, seed=None, state=None, record_moves=False):
+    """
+    Plays num_games games of uniformly random moves in lockstep, starting from the provided
+    game state (or the empty board), and seeded by the provided seed. Returns a pair (outcomes,
+    moves), where outcomes is the (N,) int8 array of the winner of each game (1 for Player X, -1
+    for Player O, and 0 for a tie), and moves is None or, if record_moves is set, the (N, 81)
+    int8 array of the row-major index r * 9 + c of each move of each game, padded with -1.
+    """
+    if state is None:
+        state = BitboardUltimateTicTacToe()
+
+    rng = np.random.default_rng(seed)
+    cells, sub_board_scores, targets = encode_state(state, num_games)
+    outcomes = np.zeros(num_games, dtype=np.int8)
+    moves = np.full((num_games, 81), -1, dtype=np.int8) if record_moves else None
+    player = state.to_move().value
+    first_move = state.previous_move is None
+
+    # The games that have not ended, as indices into the batch.
+    active = np.arange(num_games)
+    if state.is_terminal():
+        outcomes[:] = np.sign(state.utility())
+        active = active[:0]
+
+    ply = 0
+    while len(active):
+        if first_move:
+            # As in UltimateTicTacToe.actions, the first move is chosen among the moves that are
+            # distinct up to symmetry.
+            played = FIRST_ACTION_CELLS[rng.integers(len(FIRST_ACTION_CELLS), size=len(active))]
+        else:
+            # Choosing the legal cell with the largest random key chooses uniformly.
+            keys = rng.random((len(active), 81))
+            keys[~legal_move_masks(cells[active], sub_board_scores[active], targets[active])] = -1
+            played = keys.argmax(axis=1)
+        cells[active, played] = player
+        if record_moves:
+            moves[active, ply] = ROW_MAJOR_CELLS[played]
+
+        # Score the sub-boards that were played in; the first move cannot score its sub-board.
+        k = played // 9
+        if not first_move:
+            regions = cells[active[:, None], 9 * k[:, None] + np.arange(9)]
+            won = WINS_TABLE[region_masks(regions, player)]
+            full = (regions != 0).all(axis=1)
+            sub_board_scores[active, k] = np.where(won, player, np.where(full, CAT, 0))
+
+            # A game ends when a won sub-board completes a line of the large board, or when
+            # every sub-board has been scored, as in UltimateTicTacToe.is_terminal.
+            scores = sub_board_scores[active]
+            big_won = won & WINS_THROUGH_TABLE[k, region_masks(scores, player)]
+            tied = ~big_won & (scores != 0).all(axis=1)
+            outcomes[active[big_won]] = player
+            finished = big_won | tied
+        else:
+            finished = np.zeros(len(active), dtype=bool)
+
+        # The next player is forced into the sub-board matching the cell just played, unless it
+        # has been scored.
+        next_targets = played % 9
+        next_targets[sub_board_scores[active, next_targets] != 0] = FREE_TARGET
+        targets[active] = next_targets
+
+        active = active[~finished]
+        player = -player
+        first_move = False
+        ply += 1
+
+    return outcomes, moves
+
+def read_command(argv):
+    parser = optparse.OptionParser(description="Simulate random games of Ultimate Tic-Tac-Toe in batches")
+
+    parser.add_option('-n', dest='num_games', type='int', help='number of games to simulate', default=100000)
+    parser.add_option('-b', dest='batch_size', type='int', help='number of games to simulate at once', default=10000)
+    parser.add_option('--seed', dest='seed', type='int', help='the seed for the random moves', default=0)
+
+    options, _ = parser.parse_args(argv)
+    return options
+
+if __name__ == '__main__':
+    options = read_command(sys.argv)
+
+    # Each batch is seeded by the seed and its number, so that the results do not depend on
+    # anything but the options.
+    x_wins = 0
+    o_wins = 0
+    ties = 0
+    start = time.perf_counter()
+    for batch, first in enumerate(range(0, options.num_games, options.batch_size)):
+        outcomes, _ = simulate_random_games(min(options.batch_size, options.num_games - first), seed=(options.seed, batch))
+        x_wins += int(np.count_nonzero(outcomes == 1))
+        o_wins += int(np.count_nonzero(outcomes == -1))
+        ties += int(np.count_nonzero(outcomes == 0))
+    elapsed = time.perf_counter() - start
+
+    print(f'X wins:\t{x_wins}')
+    print(f'O wins:\t{o_wins}')
+    print(f'Ties:\t{ties}')
+    print(f'Games per minute:\t{options.num_games / elapsed * 60:.0f}')
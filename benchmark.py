@@ -0,0 +1,110 @@
+import optparse
+import random
+import sys
+import time
+
+import evaluation_functions
+
+from evaluation_functions import streaks
+from evaluation_functions import _sum_wins
+from evaluation_functions import _weigh_wins
+from game import load_state
+
+###################################
+### Scanning Reference Versions ###
+###################################
+
+# The evaluation functions as originally written, scanning every cell of the board with streaks.
+# They serve as the baseline of the benchmark, and the table-driven versions must match them (up to 
+# rounding, since the sub-board terms are now summed before they are weighted).
+
+def scan_count_wins(state):
+    return _sum_wins(state.sub_board_score)
+
+def scan_cell_weight_evaluation(state):
+    return _weigh_wins(state.sub_board_score)
+
+def scan_near_wins(state):
+    return 16 * streaks(state.sub_board_score, (0, 0), 2)
+
+def scan_nested_near_wins(state):
+    score = scan_near_wins(state)
+    for sub_board_row in range(3):
+        for sub_board_column in range(3):
+            score += streaks(state.board, (sub_board_row * 3, sub_board_column * 3), 2) * 0.16
+    return score
+
+def scan_shallow_simple_evaluation(state):
+    return 10 * streaks(state.sub_board_score, (0, 0), 2) + streaks(state.sub_board_score, (0, 0), 1)
+
+def scan_deep_simple_evaluation(state):
+    score = scan_shallow_simple_evaluation(state)
+    for sub_board_row in range(3):
+        for sub_board_column in range(3):
+            score += streaks(state.board, (sub_board_row * 3, sub_board_column * 3), 2) * 0.16
+            score += streaks(state.board, (sub_board_row * 3, sub_board_column * 3), 1) * 0.16
+    return score
+
+EVALUATION_FUNCTIONS = ['count_wins', 'cell_weight_evaluation', 'near_wins', 'nested_near_wins', 'shallow_simple_evaluation', 'deep_simple_evaluation']
+
+#################
+### Benchmark ###
+#################
+
+def sample_positions(state_class, num_positions, seed):
+    """
+    Collects positions from random games, as a search would encounter them at its leaves.
+    """
+    rand = random.Random(seed)
+    positions = []
+    while len(positions) < num_positions:
+        state = state_class()
+        while not state.is_terminal() and len(positions) < num_positions:
+            state = state.result(rand.choice(state.actions()))
+            positions.append(state)
+    return positions
+
+def time_per_call(function, positions, repeat):
+    """
+    Returns the mean time, in microseconds, of one call of the function over the positions.
+    """
+    start = time.perf_counter()
+    for i in range(repeat):
+        for position in positions:
+            function(position)
+    return (time.perf_counter() - start) / (repeat * len(positions)) * 1e6
+
+def benchmark_evaluation(state_class, num_positions, repeat, seed):
+    """
+    Times every evaluation function against its scanning reference version on the same leaf
+    positions, after checking that both produce the same scores. Returns a list of rows (name,
+    reference microseconds per call, table-driven microseconds per call).
+    """
+    positions = sample_positions(state_class, num_positions, seed)
+    rows = []
+    for name in EVALUATION_FUNCTIONS:
+        function = getattr(evaluation_functions, name)
+        reference = globals()['scan_' + name]
+        for position in positions:
+            if abs(function(position) - reference(position)) > 1e-9:
+                raise Exception('The ' + name + ' function does not match its reference on\n' + str(position))
+        rows.append((name, time_per_call(reference, positions, repeat), time_per_call(function, positions, repeat)))
+    return rows
+
+def read_command(argv):
+    parser = optparse.OptionParser(description="Benchmark the evaluation functions of Ultimate Tic-Tac-Toe")
+
+    parser.add_option('-n', dest='num_positions', type='int', help='number of leaf positions to evaluate', default=2000)
+    parser.add_option('-r', dest='repeat', type='int', help='number of times to evaluate each position', default=5)
+    parser.add_option('-s', dest='state', help='the game state implementation', default='BitboardUltimateTicTacToe')
+    parser.add_option('--seed', dest='seed', help='the seed for sampling positions', default='jack czenszak')
+
+    options, _ = parser.parse_args(argv)
+    return options
+
+if __name__ == '__main__':
+    options = read_command(sys.argv)
+    rows = benchmark_evaluation(load_state(options.state), options.num_positions, options.repeat, options.seed)
+    print(f'{"function":<28}{"scan (us)":>12}{"table (us)":>12}{"speedup":>10}')
+    for name, reference, table in rows:
+        print(f'{name:<28}{reference:>12.2f}{table:>12.2f}{reference / table:>9.1f}x')
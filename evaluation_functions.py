@@ -1,4 +1,10 @@
+import itertools
+import json
+import math
+import os
+
 from model import Player
+from model import register_region_feature
 
 ########################
 ### Helper Functions ###
@@ -55,35 +61,127 @@ def streaks(board, origin, size):
 
     return value
 
-############################
-### Evaluation Functions ###
-############################
+##########################
+### Precomputed Tables ###
+##########################
 
-def count_wins(state):
+def _region_streak_tables():
     """
-    Sums the values of terminal sub-boards, where X wins are valued as +1, O wins are valued 
-    as -1, and ties are valued as 0.
+    Computes the tables (near-wins, semi-near-wins) for every 3x3 region, indexed by the base-3 
+    index of the region (see model.BASE3), where digit l of the index is 0, 1, or 2 if cell l is 
+    empty, Player X, or Player O. Entry i of each table equals streaks(board, (0, 0), size) for
+    the region with index i, with sizes 2 and 1 respectively.
+    """
+    # Since itertools.product varies its last element fastest, cell l of the region is element
+    # 8 - l of each product.
+    lines = [(8 - a, 8 - b, 8 - c) for a, b, c in ((0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6))]
+    near_wins = []
+    semi_near_wins = []
+    for values in itertools.product((0, Player.X.value, Player.O.value), repeat=9):
+        sums = [values[a] + values[b] + values[c] for a, b, c in lines]
+        near_wins.append(sums.count(2) - sums.count(-2))
+        semi_near_wins.append(sums.count(1) - sums.count(-1))
+    return near_wins, semi_near_wins
+
+# REGION_NEAR_WINS[index] and REGION_SEMI_NEAR_WINS[index] are the near-wins (streaks of size 2) 
+# and semi-near-wins (streaks of size 1) of the sub-board with the provided base-3 index.
+REGION_NEAR_WINS, REGION_SEMI_NEAR_WINS = _region_streak_tables()
+
+# The sub-board terms of nested_near_wins and deep_simple_evaluation, declared as region features 
+# so that every game state maintains their sums over all sub-boards as moves are made.
+NEAR_WINS_FEATURE = register_region_feature(REGION_NEAR_WINS)
+STREAKS_FEATURE = register_region_feature([near + semi for near, semi in zip(REGION_NEAR_WINS, REGION_SEMI_NEAR_WINS)])
+
+# Maps the base-4 index of the sub-board scores (see model.BASE4) to the terms of the evaluation 
+# functions that depend only on the large board. Far fewer than the 4 ** 9 possible indices occur 
+# in practice, so the terms are computed as they are first needed.
+_big_board_term_cache = {}
+
+def _big_board_terms(state):
+    """
+    Returns the tuple (count_wins, cell_weight_evaluation, near-wins, semi-near-wins) of the 
+    large board of the provided state.
+    """
+    index = state.big_board_index()
+    terms = _big_board_term_cache.get(index)
+    if terms is None:
+        sub_board_score = [[None] * 3 for i in range(3)]
+        for k in range(9):
+            sub_board_score[k // 3][k % 3] = (None, Player.X, Player.O, Player.C)[index // 4 ** k % 4]
+        terms = (_sum_wins(sub_board_score), _weigh_wins(sub_board_score), streaks(sub_board_score, (0, 0), 2), streaks(sub_board_score, (0, 0), 1))
+        _big_board_term_cache[index] = terms
+    return terms
+
+# The eight lines of a 3x3 region, as triples of cells in row-major order, and the class of each
+# line under the symmetries of the board: edge rows and columns (0), the middle row and column 
+# (1), and the diagonals (2).
+REGION_LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]
+LINE_CLASSES = [0, 1, 0, 0, 1, 0, 2, 2]
+
+# The weights of learned_evaluation are kept as integers in units of 1 / LEARNED_WEIGHT_SCALE 
+# (the precision of the weights file), so that the sums of the weights that the game states keep
+# up to date do not depend on the order of the moves, and equal those of batch_evaluation.
+LEARNED_WEIGHT_SCALE = 100000
+
+def _load_learned_weights(path):
+    """
+    Reads the weight tables of learned_evaluation, as written by fit_evaluation.py, from the 
+    file at the provided path: a table of 3 ** 9 weights of sub-board patterns, indexed by 
+    base-3 index (see model.BASE3), and, for each line class, a table of 64 weights of line 
+    patterns of the large board, indexed by the base-4 number whose digits are the pieces of the
+    line (see model.REGION_DIGITS). The weights are returned in units of 
+    1 / LEARNED_WEIGHT_SCALE. If there is no such file, every weight is 0.
+    """
+    if not os.path.exists(path):
+        return [0] * 3 ** 9, [[0] * 64 for line_class in range(3)]
+    with open(path) as f:
+        weights = json.load(f)
+    region_weights = [round(weight * LEARNED_WEIGHT_SCALE) for weight in weights['region_weights']]
+    line_weights = [[round(weight * LEARNED_WEIGHT_SCALE) for weight in table] for table in weights['line_weights']]
+    return region_weights, line_weights
+
+LEARNED_WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'learned_weights.json')
+LEARNED_REGION_WEIGHTS, LEARNED_LINE_WEIGHTS = _load_learned_weights(LEARNED_WEIGHTS_FILE)
+
+# The sub-board term of learned_evaluation, declared as a region feature like those above.
+LEARNED_FEATURE = register_region_feature(LEARNED_REGION_WEIGHTS)
+
+# Maps the base-4 index of the sub-board scores to the large-board term of learned_evaluation, 
+# computed as it is first needed, like _big_board_term_cache.
+_learned_big_board_term_cache = {}
+
+def _learned_big_board_term(state):
+    """
+    Returns the sum of the learned weights of the lines of the large board of the provided state.
+    """
+    index = state.big_board_index()
+    term = _learned_big_board_term_cache.get(index)
+    if term is None:
+        digits = [index // 4 ** k % 4 for k in range(9)]
+        term = sum(LEARNED_LINE_WEIGHTS[line_class][digits[a] + 4 * digits[b] + 16 * digits[c]] for (a, b, c), line_class in zip(REGION_LINES, LINE_CLASSES))
+        _learned_big_board_term_cache[index] = term
+    return term
+
+def _sum_wins(sub_board_score):
+    """
+    Sums the values of the scored sub-boards.
     """
     score = 0
     for sub_board_row in range(3):
         for sub_board_column in range(3):
-            piece = state.sub_board_score[sub_board_row][sub_board_column]
+            piece = sub_board_score[sub_board_row][sub_board_column]
             if piece is not None:
                 score += piece.value
     return score
 
-def cell_weight_evaluation(state):
+def _weigh_wins(sub_board_score):
     """
-    Computes a weighted sum of terminal sub-boards; each sub-board is weighted by the number 
-    of possible wins that they can contribute to (for instance, the middle sub-board has a 
-    weight of 4, since it can contribute to winning once vertically, winning once horizontally,
-    and winning twice diagonally); X wins are valued as +1, O wins are valued as -1, and ties 
-    are valued as 0.
+    Sums the values of the scored sub-boards, weighted by the number of wins each contributes to.
     """
     score = 0
     for sub_board_row in range(3):
         for sub_board_column in range(3):
-            piece = state.sub_board_score[sub_board_row][sub_board_column]
+            piece = sub_board_score[sub_board_row][sub_board_column]
             if piece is None:
                 continue
             elif sub_board_row == 1 and sub_board_column == 1:
@@ -97,13 +195,34 @@ def cell_weight_evaluation(state):
                 score += 3 * piece.value
     return score
 
+############################
+### Evaluation Functions ###
+############################
+
+def count_wins(state):
+    """
+    Sums the values of terminal sub-boards, where X wins are valued as +1, O wins are valued 
+    as -1, and ties are valued as 0.
+    """
+    return _big_board_terms(state)[0]
+
+def cell_weight_evaluation(state):
+    """
+    Computes a weighted sum of terminal sub-boards; each sub-board is weighted by the number 
+    of possible wins that they can contribute to (for instance, the middle sub-board has a 
+    weight of 4, since it can contribute to winning once vertically, winning once horizontally,
+    and winning twice diagonally); X wins are valued as +1, O wins are valued as -1, and ties 
+    are valued as 0.
+    """
+    return _big_board_terms(state)[1]
+
 def near_wins(state):
     """
     Sums the number of “near-wins,” instances where two of the three necessary pieces are 
     placed to win, in the large board; X near-wins are weighted as +1, and O near-wins are 
     weighted as -1.
     """
-    return 16 * streaks(state.sub_board_score, (0, 0), 2)
+    return 16 * _big_board_terms(state)[2]
 
 def nested_near_wins(state):
     """
@@ -112,13 +231,7 @@ def nested_near_wins(state):
     number of near-wins (6), the total sum is weighted less than one near-win on the large 
     board.
     """
-    score = near_wins(state)
-
-    for sub_board_row in range(3):
-        for sub_board_column in range(3):
-            score += streaks(state.board, (sub_board_row * 3, sub_board_column * 3), 2) * 0.16
-
-    return score
+    return near_wins(state) + state.region_feature_sum(NEAR_WINS_FEATURE) * 0.16
 
 def shallow_simple_evaluation(state):
     """
@@ -126,7 +239,8 @@ def shallow_simple_evaluation(state):
     two empty cells, in the large board; near-wins are valued ten times more than 
     semi-near-wins, and each is multiplied by +1 if it belongs to X, -1 if it belongs to O.
     """
-    return 10 * streaks(state.sub_board_score, (0, 0), 2) + streaks(state.sub_board_score, (0, 0), 1)
+    terms = _big_board_terms(state)
+    return 10 * terms[2] + terms[3]
 
 def deep_simple_evaluation(state):
     """
@@ -135,18 +249,22 @@ def deep_simple_evaluation(state):
     the maximum number of near-wins (6), the total sum is weighted less than one near-win on 
     the large board.
     """
-    score = shallow_simple_evaluation(state)
-
-    for sub_board_row in range(3):
-        for sub_board_column in range(3):
-            score += streaks(state.board, (sub_board_row * 3, sub_board_column * 3), 2) * 0.16
-            score += streaks(state.board, (sub_board_row * 3, sub_board_column * 3), 1) * 0.16
+    score = shallow_simple_evaluation(state) + state.region_feature_sum(STREAKS_FEATURE) * 0.16
 
     if score >= 100:
         raise Exception('Evaluation exceeded 100!')
 
     return score
 
+def learned_evaluation(state):
+    """
+    Sums learned weights of the pattern of every sub-board and of every line of the large board,
+    fitted to the outcomes of self-play games by fit_evaluation.py, and squashes the sum into 
+    (-99, 99). The weights are antisymmetric, so that exchanging the pieces of X and O negates 
+    the evaluation.
+    """
+    return 99 * math.tanh((state.region_feature_sum(LEARNED_FEATURE) + _learned_big_board_term(state)) / LEARNED_WEIGHT_SCALE)
+
 def zero(state):
     """
     Returns 0.
@@ -0,0 +1,236 @@
+import json
+import optparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from batch_simulation import WINS_TABLE
+from evaluation_functions import LEARNED_WEIGHTS_FILE
+from evaluation_functions import LINE_CLASSES
+from evaluation_functions import REGION_LINES
+from model import TRANSFORMED_SUB_BOARDS
+from self_play import CHUNK_HEADER
+from self_play import CHUNK_MAGIC
+from self_play import SAMPLE
+
+###############
+### Dataset ###
+###############
+
+# The fields of a sample of self_play.py, as a NumPy record, so that chunks are read as arrays.
+SAMPLE_DTYPE = np.dtype([('x', 'u1', 11), ('o', 'u1', 11), ('player', 'i1'), ('target', 'u1'), ('score', '<f4'), ('outcome', 'i1')])
+assert SAMPLE_DTYPE.itemsize == SAMPLE.size
+
+POWERS_OF_3 = 3 ** np.arange(9)
+
+def read_samples(path):
+    """
+    Reads the samples of the chunk file at the provided path as an array of SAMPLE_DTYPE records.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, first_game, num_games, num_samples = CHUNK_HEADER.unpack_from(data)
+    if magic != CHUNK_MAGIC or len(data) != CHUNK_HEADER.size + num_samples * SAMPLE.size:
+        raise Exception('The file ' + path + ' is not a self-play chunk!')
+    return np.frombuffer(data, dtype=SAMPLE_DTYPE, offset=CHUNK_HEADER.size)
+
+def encode_samples(samples):
+    """
+    Returns a pair (region_indices, big_board_digits) of the provided samples, where
+    region_indices is the (N, 9) array of the base-3 indices of the sub-boards (see model.BASE3),
+    and big_board_digits is the (N, 9) array of the sub-board scores, coded as in
+    model.REGION_DIGITS.
+    """
+    x = np.unpackbits(samples['x'], axis=1, bitorder='little')[:, :81].reshape(-1, 9, 9)
+    o = np.unpackbits(samples['o'], axis=1, bitorder='little')[:, :81].reshape(-1, 9, 9)
+    region_indices = (x + 2 * o) @ POWERS_OF_3
+
+    # A sub-board is won by the player with a line in it, and tied if it is full without one.
+    x_won = WINS_TABLE[x @ (1 << np.arange(9))]
+    o_won = WINS_TABLE[o @ (1 << np.arange(9))]
+    full = (x | o).all(axis=2)
+    big_board_digits = np.where(x_won, 1, np.where(o_won, 2, np.where(full, 3, 0)))
+    return region_indices, big_board_digits
+
+def load_dataset(directory, validation_interval):
+    """
+    Reads the samples of every chunk of the dataset in the provided directory, and returns the
+    pair (training, validation) of arrays of samples, where every chunk whose index is a multiple
+    of validation_interval is held out for validation (if there is more than one chunk), so that
+    no game is split between the two.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.startswith('chunk-') and name.endswith('.bin'))
+    if not names:
+        raise Exception('There are no self-play chunks in ' + directory + '!')
+    training = []
+    validation = []
+    for i, name in enumerate(names):
+        samples = read_samples(os.path.join(directory, name))
+        (validation if len(names) > 1 and i % validation_interval == 0 else training).append(samples)
+    return np.concatenate(training), np.concatenate(validation) if validation else np.zeros(0, dtype=SAMPLE_DTYPE)
+
+##################
+### Parameters ###
+##################
+
+# The weights are tied so that the evaluation respects the symmetries of the game: patterns that
+# are images of each other under a symmetry of the board share a parameter, and exchanging the
+# pieces of X and O negates it. Each weight is thus a parameter times a sign of -1, 0 (for
+# patterns that are their own image with the pieces exchanged), or 1.
+
+def tie_weights(images, swapped_images):
+    """
+    Returns the pair (keys, signs) of a set of patterns, given the indices of their images under
+    every symmetry and of their images with the pieces exchanged, each of shape (N, S). Patterns
+    share a parameter if and only if they share a key.
+    """
+    representative = images.min(axis=1)
+    swapped_representative = swapped_images.min(axis=1)
+    signs = np.sign(swapped_representative - representative)
+    return np.minimum(representative, swapped_representative), signs
+
+def region_parameters():
+    """
+    Returns the pair (keys, signs) of every sub-board pattern, indexed by its base-3 index.
+    """
+    indices = np.arange(3 ** 9)
+    digits = indices[:, None] // POWERS_OF_3 % 3
+    images = []
+    swapped_images = []
+    for symmetry in range(8):
+        image = np.empty_like(digits)
+        image[:, TRANSFORMED_SUB_BOARDS[symmetry]] = digits
+        images.append(image @ POWERS_OF_3)
+        swapped_images.append(((3 - image) % 3) @ POWERS_OF_3)
+    return tie_weights(np.stack(images, axis=1), np.stack(swapped_images, axis=1))
+
+def line_parameters():
+    """
+    Returns the pair (keys, signs) of every line pattern of each line class, as (3, 64) arrays,
+    where line patterns are indexed by base-4 number (see _load_learned_weights). Within a class,
+    a line and its reverse are images of each other.
+    """
+    patterns = np.arange(64)
+    a, b, c = patterns % 4, patterns // 4 % 4, patterns // 16
+    swap = np.array([0, 2, 1, 3])
+    images = np.stack([a + 4 * b + 16 * c, c + 4 * b + 16 * a], axis=1)
+    swapped_images = np.stack([swap[a] + 4 * swap[b] + 16 * swap[c], swap[c] + 4 * swap[b] + 16 * swap[a]], axis=1)
+    keys, signs = tie_weights(images, swapped_images)
+    return np.stack([keys + 3 ** 9 + 64 * line_class for line_class in range(3)]), np.stack([signs] * 3)
+
+class Features():
+    """
+    The parameters that each sample of a set of samples depends on, as (N, 17) arrays of
+    parameter indices and signs: one for each sub-board and one for each line of the large board.
+    """
+
+    def __init__(self, samples, region_keys, region_signs, line_keys, line_signs, parameter_index):
+        region_indices, big_board_digits = encode_samples(samples)
+        line_patterns = [big_board_digits[:, a] + 4 * big_board_digits[:, b] + 16 * big_board_digits[:, c] for a, b, c in REGION_LINES]
+        keys = np.concatenate([region_keys[region_indices], np.stack([line_keys[line_class][pattern] for pattern, line_class in zip(line_patterns, LINE_CLASSES)], axis=1)], axis=1)
+        self.signs = np.concatenate([region_signs[region_indices], np.stack([line_signs[line_class][pattern] for pattern, line_class in zip(line_patterns, LINE_CLASSES)], axis=1)], axis=1).astype(np.float64)
+        self.parameters = parameter_index[keys]
+
+    def sums(self, parameters):
+        """
+        Returns the (N,) array of the sums of the weights of every sample.
+        """
+        return (parameters[self.parameters] * self.signs).sum(axis=1)
+
+###############
+### Fitting ###
+###############
+
+def targets(samples, score_weight):
+    """
+    Returns the values that the evaluation (divided by 99) is fitted to: the outcome of the game
+    of each sample, blended with the search score (divided by 100) where there is one.
+    """
+    outcomes = samples['outcome'].astype(np.float64)
+    scores = np.clip(samples['score'].astype(np.float64) / 100, -1, 1)
+    return np.where(np.isnan(scores), outcomes, (1 - score_weight) * outcomes + score_weight * np.nan_to_num(scores))
+
+def loss(features, parameters, goals):
+    return np.mean((np.tanh(features.sums(parameters)) - goals) ** 2) if len(goals) else float('nan')
+
+def fit(features, goals, num_parameters, epochs, learning_rate, regularization, validation=None):
+    """
+    Fits the parameters by minimizing the mean squared error between the tanh of the sums of the
+    weights and the goals, plus an L2 penalty, with full-batch Adam. If validation is a pair
+    (features, goals), the parameters with the least validation error are returned.
+    """
+    parameters = np.zeros(num_parameters)
+    first_moment = np.zeros(num_parameters)
+    second_moment = np.zeros(num_parameters)
+    best = (float('inf'), parameters)
+    for epoch in range(1, epochs + 1):
+        predictions = np.tanh(features.sums(parameters))
+        errors = 2 * (predictions - goals) * (1 - predictions ** 2) / len(goals)
+        gradient = np.bincount(features.parameters.ravel(), weights=(features.signs * errors[:, None]).ravel(), minlength=num_parameters) + 2 * regularization * parameters
+
+        first_moment = 0.9 * first_moment + 0.1 * gradient
+        second_moment = 0.999 * second_moment + 0.001 * gradient ** 2
+        parameters = parameters - learning_rate * (first_moment / (1 - 0.9 ** epoch)) / (np.sqrt(second_moment / (1 - 0.999 ** epoch)) + 1e-8)
+
+        if validation is not None and len(validation[1]):
+            validation_loss = loss(validation[0], parameters, validation[1])
+            if validation_loss < best[0]:
+                best = (validation_loss, parameters)
+        if epoch % 50 == 0 or epoch == epochs:
+            print(f'Epoch {epoch}: training error {loss(features, parameters, goals):.4f}, validation error {loss(validation[0], parameters, validation[1]) if validation is not None else float("nan"):.4f}')
+            sys.stdout.flush()
+    return best[1] if validation is not None and len(validation[1]) else parameters
+
+def save_weights(path, parameters, region_keys, region_signs, line_keys, line_signs, parameter_index):
+    """
+    Writes the weight tables of the fitted parameters to the file at the provided path (see
+    evaluation_functions._load_learned_weights), replacing it atomically.
+    """
+    region_weights = parameters[parameter_index[region_keys]] * region_signs
+    line_weights = parameters[parameter_index[line_keys]] * line_signs
+    weights = {
+        'region_weights': [round(float(weight), 5) for weight in region_weights],
+        'line_weights': [[round(float(weight), 5) for weight in table] for table in line_weights],
+    }
+    with open(path + '.tmp', 'w') as f:
+        json.dump(weights, f, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+
+def read_command(argv):
+    parser = optparse.OptionParser(description="Fit the weights of learned_evaluation to a dataset of self-play games (see self_play.py)")
+
+    parser.add_option('-f', dest='directory', help='the directory of the dataset', default='self_play')
+    parser.add_option('-w', dest='weights_file', help='the file to write the weights to', default=LEARNED_WEIGHTS_FILE)
+    parser.add_option('-e', dest='epochs', type='int', help='the number of passes over the dataset', default=500)
+    parser.add_option('-l', dest='learning_rate', type='float', help='the learning rate', default=0.02)
+    parser.add_option('-r', dest='regularization', type='float', help='the L2 penalty of the weights', default=3e-3)
+    parser.add_option('-s', dest='score_weight', type='float', help='the weight of the search scores against the game outcomes in the fitted values', default=0.0)
+    parser.add_option('-v', dest='validation_interval', type='int', help='hold out every Vth chunk of the dataset for validation', default=10)
+
+    options, _ = parser.parse_args(argv)
+    return options
+
+if __name__ == '__main__':
+    options = read_command(sys.argv)
+    start = time.perf_counter()
+
+    region_keys, region_signs = region_parameters()
+    line_keys, line_signs = line_parameters()
+    # Parameters are numbered by their keys; patterns with a sign of 0 use any parameter.
+    used_keys = np.unique(np.concatenate([region_keys, line_keys.ravel()]))
+    parameter_index = np.zeros(used_keys.max() + 1, dtype=np.intp)
+    parameter_index[used_keys] = np.arange(len(used_keys))
+
+    training, validation = load_dataset(options.directory, options.validation_interval)
+    print(f'Read {len(training)} training and {len(validation)} validation positions')
+    training_features = Features(training, region_keys, region_signs, line_keys, line_signs, parameter_index)
+    validation_features = Features(validation, region_keys, region_signs, line_keys, line_signs, parameter_index)
+    training_goals = targets(training, options.score_weight)
+    validation_goals = targets(validation, options.score_weight)
+    print(f'Validation error of a zero evaluation: {np.mean(validation_goals ** 2) if len(validation_goals) else float("nan"):.4f}')
+
+    parameters = fit(training_features, training_goals, len(used_keys), options.epochs, options.learning_rate, options.regularization, (validation_features, validation_goals))
+    save_weights(options.weights_file, parameters, region_keys, region_signs, line_keys, line_signs, parameter_index)
+    print(f'Wrote {options.weights_file} in {time.perf_counter() - start:.1f} seconds')
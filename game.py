@@ -1,17 +1,40 @@
+import functools
+import json
+import multiprocessing
 import optparse
 import sys
 
 from agents import Agent
 from agents import HumanAgent
 
-from model import UltimateTicTacToe
 from model import Player
 
+from profiling import Profiler
+from profiling import merge_records
+from profiling import write_collapsed
+from profiling import write_histogram
+
 def read_command(argv):
     parser = optparse.OptionParser(description="Run games of Ultimate Tic-Tac-Toe")
 
     parser.add_option('-n', dest='num_games', type='int', help='number of games to run', default=1)
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', help='number of games to run in parallel', default=1)
     parser.add_option('-g', dest='graphics', help='if graphics should be displayed', action="store_true")
+    parser.add_option('-s', dest='state', help='the game state implementation', default='BitboardUltimateTicTacToe')
+    parser.add_option('--stats', dest='stats', type='choice', choices=['json', 'table'], help='report the search statistics of every move as JSON lines (json) or a summary table (table)')
+    parser.add_option('--stats-file', dest='stats_file', help='the file to write the search statistics to, instead of standard output')
+    parser.add_option('--profile', dest='profile', type='choice', choices=['collapsed', 'histogram'], help='profile the game states and evaluation functions, reporting collapsed stacks for flame graphs (collapsed) or a table of functions (histogram)')
+    parser.add_option('--profile-file', dest='profile_file', help='the file to write the profile to, instead of standard output')
+    add_agent_options(parser)
+
+    options, _ = parser.parse_args(argv)
+    
+    return split_options(options)
+
+def add_agent_options(parser):
+    """
+    Adds the options of the X and O agents to the provided parser.
+    """
     parser.add_option('-x', dest='x_type', help='the agent type for the X player', default='RandomAgent')
     parser.add_option('-o', dest='o_type', help='the agent type for the O player', default='RandomAgent')
     parser.add_option('--xs', dest='x_seed', help='the seed for the X player', default='jack czenszak')
@@ -20,9 +43,34 @@ def read_command(argv):
     parser.add_option('--oe', dest='o_evaluation_function', help='the evaluation function for the O agent', default='count_wins')
     parser.add_option('--xd', dest='x_depth', type='int', help='the search depth for the X agent', default=4)
     parser.add_option('--od', dest='o_depth', type='int', help='the search depth for the O agent', default=4)
+    parser.add_option('--xt', dest='x_time_limit', type='int', help='the time limit per move in milliseconds for the X agent (overrides the search depth)')
+    parser.add_option('--ot', dest='o_time_limit', type='int', help='the time limit per move in milliseconds for the O agent (overrides the search depth)')
+    parser.add_option('--xno-ordering', dest='x_ordering', help='if the X agent should not order its moves with killer and history heuristics', action='store_false', default=True)
+    parser.add_option('--ono-ordering', dest='o_ordering', help='if the O agent should not order its moves with killer and history heuristics', action='store_false', default=True)
+    parser.add_option('--xi', dest='x_iterations', type='int', help='the number of search iterations per move for the X agent', default=1000)
+    parser.add_option('--oi', dest='o_iterations', type='int', help='the number of search iterations per move for the O agent', default=1000)
+    parser.add_option('--xw', dest='x_workers', type='int', help='the number of worker processes searching for the X agent', default=1)
+    parser.add_option('--ow', dest='o_workers', type='int', help='the number of worker processes searching for the O agent', default=1)
+    parser.add_option('--xshared-tt', dest='x_shared_tt', help='if the workers of the X agent should share one transposition table', action='store_true', default=False)
+    parser.add_option('--oshared-tt', dest='o_shared_tt', help='if the workers of the O agent should share one transposition table', action='store_true', default=False)
+    parser.add_option('--xendgame', dest='x_endgame_threshold', type='int', help='the number of open cells at which the X agent solves the game exactly (0 to disable)', default=0)
+    parser.add_option('--oendgame', dest='o_endgame_threshold', type='int', help='the number of open cells at which the O agent solves the game exactly (0 to disable)', default=0)
+    parser.add_option('--xbook', dest='x_book', help='the opening book file for the X agent')
+    parser.add_option('--obook', dest='o_book', help='the opening book file for the O agent')
+    parser.add_option('--xeval-cache', dest='x_eval_cache_size', type='int', help='the number of evaluations cached by the X agent (0 to disable)', default=0)
+    parser.add_option('--oeval-cache', dest='o_eval_cache_size', type='int', help='the number of evaluations cached by the O agent (0 to disable)', default=0)
+    parser.add_option('--xponder', dest='x_ponder', help="if the X agent should search on the O agent's time", action='store_true', default=False)
+    parser.add_option('--oponder', dest='o_ponder', help="if the O agent should search on the X agent's time", action='store_true', default=False)
+    parser.add_option('--xdb', dest='x_database', help='the position database file for the X agent')
+    parser.add_option('--odb', dest='o_database', help='the position database file for the O agent')
+    parser.add_option('--xtt', dest='x_tt_size', type='int', help='the number of transposition table entries for the X agent (0 to disable)', default=1 << 18)
+    parser.add_option('--ott', dest='o_tt_size', type='int', help='the number of transposition table entries for the O agent (0 to disable)', default=1 << 18)
 
-    options, _ = parser.parse_args(argv)
-    
+def split_options(options):
+    """
+    Splits the parsed options into the options of the X agent, the options of the O agent, and
+    the remaining options, removing the prefixes of the agent options.
+    """
     x_options = {key[2:]: getattr(options, key) for key in vars(options) if key.startswith('x_')}
     o_options = {key[2:]: getattr(options, key) for key in vars(options) if key.startswith('o_')}
     game_options = {key: getattr(options, key) for key in vars(options) if not key.startswith('x_') and not key.startswith('o_')}
@@ -44,41 +92,168 @@ def load_agent(options):
 
     return agent_class(**kwargs)
 
-def run_games(x_options, o_options, game_options):
-    x = load_agent(x_options)
-    o = load_agent(o_options)
+def load_state(name):
+    module = __import__("model")
+    if not name in dir(module):
+        raise Exception('The ' + name + ' game state is not defined!')
+    return getattr(module, name)
 
-    x_wins = 0
-    o_wins = 0
-    ties = 0
+def derive_options(options, index):
+    """
+    Returns a copy of the agent options whose seed is derived deterministically from the seed
+    option and the index of the game, so that every game is reproducible on its own.
+    """
+    options = dict(options)
+    options['seed'] = f"{options['seed']}-{index}"
+    return options
+
+def move_record(index, ply, player, agent, action):
+    """
+    Returns the search statistics of the agent's most recent move as a dictionary, together with
+    the index of the game, the ply of the move, the player, and the move itself.
+    """
+    record = {'game': index + 1, 'ply': ply, 'player': player.name, 'agent': type(agent).__name__, 'action': list(action)}
+    record.update(agent.stats.to_dict())
+    return record
 
-    for i in range(game_options['num_games']):
-        game = UltimateTicTacToe()
+def play_game(x_options, o_options, game_options, index):
+    """
+    Plays the game with the provided index between newly loaded agents, returning the index, 
+    the final state as a string, its utility, the list of the search statistics of every move 
+    played by a searching agent (if requested), and the records of the profile of the game (if 
+    requested).
+    """
+    profiler = None
+    if game_options['profile'] is not None:
+        profiler = Profiler()
+        profiler.install([x_options['evaluation_function'], o_options['evaluation_function']])
 
+    try:
+        x = load_agent(derive_options(x_options, index))
+        o = load_agent(derive_options(o_options, index))
+    except Exception:
+        if profiler is not None:
+            profiler.uninstall()
+        raise
+    game = load_state(game_options['state'])()
+    records = []
+
+    # The time of each agent is attributed to the agent, so that the profiles of both players 
+    # can be told apart.
+    if profiler is not None:
+        x.getAction = profiler.wrap(x.getAction, f'X:{type(x).__name__}')
+        o.getAction = profiler.wrap(o.getAction, f'O:{type(o).__name__}')
+
+    try:
         if isinstance(x, HumanAgent) or isinstance(o, HumanAgent) or game_options['graphics']:
             from graphics import begin_graphics
             game = begin_graphics(game, x, o)
         else:
+            ply = 0
             while not game.is_terminal():
-                if game.to_move() == Player.X:
-                    game = game.result(x.getAction(game))
-                elif game.to_move() == Player.O:
-                    game = game.result(o.getAction(game))
-        
-        print(game)
-
-        if game.utility() == 100:
-            x_wins = x_wins + 1
-            print('PLAYER X WINS')
-        elif game.utility() == -100:
-            o_wins = o_wins + 1
-            print('PLAYER O WINS')
-        elif game.utility() == 0:
-            ties = ties + 1
-            print('TIED GAME')
-
-    return x_wins, o_wins, ties        
-    
+                agent = x if game.to_move() == Player.X else o
+                action = agent.getAction(game)
+                if game_options['stats'] is not None and agent.stats is not None:
+                    records.append(move_record(index, ply, game.to_move(), agent, action))
+                x.observeAction(game, action)
+                o.observeAction(game, action)
+                game = game.result(action)
+                ply += 1
+    finally:
+        x.close()
+        o.close()
+        if profiler is not None:
+            profiler.uninstall()
+
+    return index, str(game), game.utility(), records, profiler.records if profiler is not None else {}
+
+def print_stats_table(records, file):
+    """
+    Prints a summary table of the search statistics of the provided moves for each player.
+    """
+    print(f'{"player":<8}{"agent":<14}{"moves":>7}{"nodes":>12}{"evals":>12}{"terminals":>11}{"cutoffs":>10}{"tt hits":>9}{"depth":>7}{"ebf":>7}{"nodes/s":>10}{"seconds":>9}', file=file)
+    for player in (Player.X.name, Player.O.name):
+        moves = [record for record in records if record['player'] == player]
+        if not moves:
+            continue
+        tt_probes = sum(record['tt_probes'] for record in moves)
+        branching_factors = [record['effective_branching_factor'] for record in moves if record['effective_branching_factor'] is not None]
+        seconds = sum(record['seconds'] for record in moves)
+        nodes = sum(record['nodes'] for record in moves)
+
+        tt_hit_rate = f'{sum(record["tt_hits"] for record in moves) / tt_probes:.1%}' if tt_probes > 0 else '-'
+        effective_branching_factor = f'{sum(branching_factors) / len(branching_factors):.2f}' if branching_factors else '-'
+        print(f'{player:<8}{moves[0]["agent"]:<14}{len(moves):>7}{nodes:>12}{sum(record["evaluations"] for record in moves):>12}'
+              f'{sum(record["terminals"] for record in moves):>11}{sum(sum(record["cutoffs"]) for record in moves):>10}{tt_hit_rate:>9}'
+              f'{sum(record["depth"] for record in moves) / len(moves):>7.2f}{effective_branching_factor:>7}{nodes / seconds if seconds > 0 else 0:>10.0f}{seconds:>9.2f}', file=file)
+
+def run_games(x_options, o_options, game_options):
+    """
+    Plays the requested number of games, across a pool of game_options['jobs'] processes if more
+    than one job is requested, and reports the result of each game as it finishes.
+    """
+    x_wins = 0
+    o_wins = 0
+    ties = 0
+    records = []
+    profile = {}
+    stats_file = open(game_options['stats_file'], 'w') if game_options['stats_file'] is not None else sys.stdout
+
+    play = functools.partial(play_game, x_options, o_options, game_options)
+    indices = range(game_options['num_games'])
+
+    if game_options['jobs'] > 1:
+        if 'HumanAgent' in (x_options['type'], o_options['type']) or game_options['graphics']:
+            raise Exception('Games with graphics cannot be run in parallel!')
+        if x_options['workers'] > 1 or o_options['workers'] > 1:
+            raise Exception('Agents with worker processes cannot play games in parallel!')
+        pool = multiprocessing.Pool(game_options['jobs'])
+        results = pool.imap_unordered(play, indices)
+    else:
+        pool = None
+        results = map(play, indices)
+
+    try:
+        for i, game, utility, game_records, game_profile in results:
+            if game_options['stats'] == 'json':
+                for record in game_records:
+                    print(json.dumps(record), file=stats_file)
+            records += game_records
+            merge_records(profile, game_profile)
+
+            print(f'GAME {i + 1}')
+            print(game)
+
+            if utility == 100:
+                x_wins = x_wins + 1
+                print('PLAYER X WINS')
+            elif utility == -100:
+                o_wins = o_wins + 1
+                print('PLAYER O WINS')
+            elif utility == 0:
+                ties = ties + 1
+                print('TIED GAME')
+            sys.stdout.flush()
+        if game_options['stats'] == 'table':
+            print_stats_table(records, stats_file)
+        if game_options['profile'] is not None:
+            profile_file = open(game_options['profile_file'], 'w') if game_options['profile_file'] is not None else sys.stdout
+            try:
+                if game_options['profile'] == 'collapsed':
+                    write_collapsed(profile, profile_file)
+                else:
+                    write_histogram(profile, profile_file)
+            finally:
+                if profile_file is not sys.stdout:
+                    profile_file.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if stats_file is not sys.stdout:
+            stats_file.close()
+
+    return x_wins, o_wins, ties
+
 if __name__ == '__main__':
     x_options, o_options, game_options = read_command(sys.argv)
     x_wins, o_wins, ties = run_games(x_options, o_options, game_options)
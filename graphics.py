@@ -1,6 +1,10 @@
-import tkinter
+import queue
 import sys
+import threading
+import time
+import tkinter
 
+from agents import HumanAgent
 from model import Player
 
 # Graphical constants for the GUI
@@ -22,16 +26,26 @@ AVAILABLE_ACTION_COLOR = '#F7E759'
 TERMINAL_BOARD_COLOR = '#C8C8C8'
 
 FONT = ('Helvetica', '30', 'bold')
+STATUS_FONT = ('Helvetica', '12')
 
 # Variables for controlling the GUI
 window = None
 canvas = None
 
+status = None
+
 game = None
 x = None
 o = None
 
-clicked = None
+# Agents search on a worker thread, which posts each action to results (as a pair (action, 
+# error)), while clicks holds the cells clicked by the user for a HumanAgent to take.
+worker = None
+turn_start = None
+cancelled = False
+search_error = None
+results = queue.Queue()
+clicks = queue.Queue()
 
 def begin_graphics(game_state, player_x, player_o):
     """
@@ -40,29 +54,34 @@ def begin_graphics(game_state, player_x, player_o):
     and player_o as Player X and Player O, respectively.
     """
     
-    global window, canvas, game, x, o, clicked
+    global window, canvas, status, game, x, o, search_error
     
     end_graphics()
 
     window = tkinter.Tk()
     window.title(TITLE)
     window.resizable(False, False)
-    window.protocol('WM_DELETE_WINDOW', lambda : sys.exit(0))
+    window.protocol('WM_DELETE_WINDOW', close_window)
+    window.bind('<Escape>', cancel_turn)
     
     canvas = tkinter.Canvas(window, bg=BACKGROUND_COLOR, height=WINDOW_SIZE, width=WINDOW_SIZE)
     canvas.pack()
     canvas.bind("<Button-1>", left_click)
+    status = tkinter.Label(window, anchor='w', font=STATUS_FONT)
+    status.pack(fill='x')
 
     game = game_state
     x = player_x
     o = player_o
-    clicked = None
+    search_error = None
 
     draw_board()
 
     window.after(DELAY, next_turn)
     window.mainloop()
 
+    if search_error is not None:
+        raise search_error
     return game
     
 def left_click(event):
@@ -71,19 +90,50 @@ def left_click(event):
     window if the game is over or stores the cell clicked otherwise.
     """
 
-    global clicked
-
     if game is None or game.is_terminal():
         end_graphics()
+        return
 
-    clicked = (event.y // CELL_SIZE, event.x // CELL_SIZE)
+    clicks.put((event.y // CELL_SIZE, event.x // CELL_SIZE))
 
 def get_clicked():
     """
-    Retrieves the cell most recently clicked by the user.
+    Waits for the user to click a cell, and returns it, or None if the window is closed first.
+    It is called by a HumanAgent on the worker thread.
+    """
+
+    return clicks.get()
+
+def cancel_turn(event=None):
+    """
+    Asks the agent to move, unless it is a HumanAgent, to stop searching and play the best 
+    action it has found so far.
+    """
+
+    global cancelled
+
+    if worker is None or isinstance(to_move(), HumanAgent):
+        return
+    cancelled = True
+    to_move().stop()
+
+def close_window():
+    """
+    Stops the search of the agent to move and exits.
+    """
+
+    if worker is not None:
+        to_move().stop()
+        clicks.put(None)
+        worker.join()
+    sys.exit(0)
+
+def to_move():
+    """
+    Returns the agent to move in the current game.
     """
 
-    return clicked
+    return x if game.to_move() == Player.X else o
 
 def draw_board():
     """
@@ -259,22 +309,87 @@ def draw_board():
         draw_background()
         draw_pieces()
 
+def draw_status():
+    """
+    Shows whose turn it is, and the progress of the agent to move if it is searching.
+    """
+
+    if game.is_terminal():
+        text = 'Click to close the window.'
+    elif isinstance(to_move(), HumanAgent):
+        text = f'Player {game.to_move().name} to move: click a highlighted cell.'
+    else:
+        text = f'Player {game.to_move().name} ({type(to_move()).__name__}) is thinking'
+        progress = to_move().search_progress()
+        if progress is not None:
+            depth, nodes, seconds = progress
+            if depth:
+                text += f', depth {depth}'
+            text += f', {nodes / seconds if seconds > 0 else 0:,.0f} nodes/s'
+        text += f', {time.perf_counter() - turn_start:.1f} s'
+        text += ' (stopping...)' if cancelled else ' (press Escape to play now)'
+
+    if status['text'] != text:
+        status['text'] = text
+
+def search(agent, state):
+    """
+    Asks the provided agent for its action in the provided state, on the worker thread, and 
+    posts the result for the main loop.
+    """
+
+    try:
+        results.put((agent.getAction(state), None))
+    except Exception as error:
+        results.put((None, error))
+
+def start_turn():
+    """
+    Starts the search of the agent to move on a new worker thread, discarding the cells clicked
+    before its turn.
+    """
+
+    global worker, turn_start, cancelled
+
+    while not clicks.empty():
+        clicks.get()
+    turn_start = time.perf_counter()
+    cancelled = False
+    # The stop request of the previous turn is cleared before the worker starts, so that a 
+    # request made as soon as this turn begins is kept.
+    to_move().stop_search.clear()
+    worker = threading.Thread(target=search, args=(to_move(), game), daemon=True)
+    worker.start()
+
 def next_turn():
     """
-    Recursively controls the game.
+    Recursively controls the game. Agents search on a worker thread, which this function polls
+    every DELAY milliseconds, so that the window stays responsive while they think.
     """
     
-    global game
+    global game, worker, search_error
 
     if game is None or game.is_terminal():
         return
 
-    if game.to_move() == Player.X:
-        game = game.result(x.getAction(game))
-    elif game.to_move() == Player.O:
-        game = game.result(o.getAction(game))
-
-    draw_board()
+    if worker is None:
+        start_turn()
+    elif not results.empty():
+        action, error = results.get()
+        worker.join()
+        worker = None
+        if error is not None:
+            search_error = error
+            end_graphics()
+            return
+        if action is None:
+            return
+        x.observeAction(game, action)
+        o.observeAction(game, action)
+        game = game.result(action)
+        draw_board()
+
+    draw_status()
 
     if window is not None:
         window.after(DELAY, next_turn)
@@ -284,11 +399,12 @@ def end_graphics():
     Destroys the current window.
     """
 
-    global window, canvas, clicked
+    global window, canvas, status
     try:
         if window is not None:
             window.destroy()
     finally:
         window = None
         canvas = None
-        clicked = None
+        status = None
+        clicks.put(None)
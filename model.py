@@ -1,4 +1,5 @@
 import copy
+import random
 from enum import Enum
 
 class Player(Enum):
@@ -19,11 +20,14 @@ class UltimateTicTacToe:
     Represents a game of Ultimate Tic-Tac-Toe.
     """
 
-    def __init__(self, board=[[None for j in range(9)] for i in range(9)], sub_board_score=[[None for j in range(3)] for i in range(3)],  player_to_move=Player.X, previous_move=None):
+    def __init__(self, board=[[None for j in range(9)] for i in range(9)], sub_board_score=[[None for j in range(3)] for i in range(3)],  player_to_move=Player.X, previous_move=None, zobrist_hash=None, region_indices=None, region_feature_sums=None):
         self.board = board
         self.sub_board_score = sub_board_score
         self.player_to_move = player_to_move
         self.previous_move = previous_move
+        self.zobrist_hash = zobrist_hash if zobrist_hash is not None else compute_zobrist_hash(board, sub_board_score, player_to_move, previous_move)
+        self._region_indices = region_indices if region_indices is not None else self.compute_region_indices()
+        self._region_feature_sums = region_feature_sums if region_feature_sums is not None else compute_region_feature_sums(self._region_indices)
 
     def to_move(self):
         """
@@ -111,7 +115,22 @@ class UltimateTicTacToe:
                 elif UltimateTicTacToe.no_none(new_board, (r // 3) * 3, (c // 3) * 3, (r // 3) * 3 + 3, (c // 3) * 3 + 3):
                     new_sub_board_score[r // 3][c // 3] = Player.C
 
-            return UltimateTicTacToe(board=new_board, sub_board_score=new_sub_board_score, player_to_move=self.player_to_move.get_opponent(), previous_move=action)
+            # Update the Zobrist hash incrementally with the new piece, the change of turn, and 
+            # the change of forced sub-board.
+            new_hash = self.zobrist_hash ^ ZOBRIST_CELLS[self.player_to_move][CELL_BIT[r][c]] ^ ZOBRIST_O_TO_MOVE
+            new_hash ^= ZOBRIST_TARGETS[target_index(self.sub_board_score, self.previous_move)] ^ ZOBRIST_TARGETS[target_index(new_sub_board_score, action)]
+
+            # Update the index of the sub-board played in, and the feature sums with it.
+            k = (r // 3) * 3 + c // 3
+            old_index = self._region_indices[k]
+            new_index = old_index + POWERS_OF_3[(r % 3) * 3 + c % 3] * (1 if self.player_to_move is Player.X else 2)
+            new_region_indices = list(self._region_indices)
+            new_region_indices[k] = new_index
+            if len(self._region_feature_sums) != len(READ_REGION_FEATURES):
+                self._region_feature_sums = compute_region_feature_sums(self._region_indices, self._region_feature_sums)
+            new_region_feature_sums = update_region_feature_sums(self._region_feature_sums, old_index, new_index)
+
+            return UltimateTicTacToe(board=new_board, sub_board_score=new_sub_board_score, player_to_move=self.player_to_move.get_opponent(), previous_move=action, zobrist_hash=new_hash, region_indices=new_region_indices, region_feature_sums=new_region_feature_sums)
 
     def is_terminal(self):
         """
@@ -150,6 +169,63 @@ class UltimateTicTacToe:
         else:
             return 0
 
+    def region_indices(self):
+        """
+        Returns the base-3 index of each sub-board (see BASE3), in row-major order.
+        """
+
+        return list(self._region_indices)
+
+    def region_feature_sum(self, feature):
+        """
+        Returns the sum of the registered feature (see register_region_feature) over all 
+        sub-boards.
+        """
+
+        slot = region_feature_slot(feature)
+        if slot >= len(self._region_feature_sums):
+            self._region_feature_sums = compute_region_feature_sums(self._region_indices, self._region_feature_sums)
+        return self._region_feature_sums[slot]
+
+    def compute_region_indices(self):
+        """
+        Computes the base-3 index of each sub-board from scratch.
+        """
+
+        indices = []
+        for sub_board_row in range(0, 9, 3):
+            rows = self.board[sub_board_row:sub_board_row + 3]
+            for sub_board_column in range(0, 9, 3):
+                index = 0
+                for cell in reversed([piece for row in rows for piece in row[sub_board_column:sub_board_column + 3]]):
+                    index *= 3
+                    if cell is Player.X:
+                        index += 1
+                    elif cell is Player.O:
+                        index += 2
+                indices.append(index)
+        return indices
+
+    def big_board_index(self):
+        """
+        Returns the base-4 index of the sub-board scores (see BASE4).
+        """
+
+        index = 0
+        for piece in reversed([piece for row in self.sub_board_score for piece in row]):
+            index *= 4
+            if piece is not None:
+                index += REGION_DIGITS[piece]
+        return index
+
+    def canonical(self):
+        """
+        Returns a pair (key, symmetry) identifying this state up to symmetry; see 
+        BitboardUltimateTicTacToe.canonical.
+        """
+
+        return BitboardUltimateTicTacToe.from_state(self).canonical()
+
     def __str__(self):
         s = ''
         for row in range(9):
@@ -220,3 +296,613 @@ class UltimateTicTacToe:
         
         return True
 
+
+#########################
+### Bitboard Geometry ###
+#########################
+
+# Cells are numbered 0-80 such that bit (9 * k + l) corresponds to cell l of sub-board k, where 
+# both sub-boards and the cells within them are numbered 0-8 in row-major order.
+CELL_BIT = [[((r // 3) * 3 + c // 3) * 9 + (r % 3) * 3 + c % 3 for c in range(9)] for r in range(9)]
+BIT_CELL = [((k // 3) * 3 + l // 3, (k % 3) * 3 + l % 3) for k in range(9) for l in range(9)]
+
+FULL_SUB_BOARD = 0x1FF
+
+# The eight winning lines of a 3x3 region, encoded as 9-bit masks.
+LINE_MASKS = [0b000000111, 0b000111000, 0b111000000, 0b001001001, 0b010010010, 0b100100100, 0b100010001, 0b001010100]
+
+# WINS[mask] determines if the 9-bit mask contains a winning line, and WINS_THROUGH[k][mask] 
+# determines if the mask contains a winning line that passes through cell k.
+WINS = [any(mask & line == line for line in LINE_MASKS) for mask in range(512)]
+WINS_THROUGH = [[any(mask & line == line for line in LINE_MASKS if line >> k & 1) for mask in range(512)] for k in range(9)]
+
+# BASE3[mask] and BASE4[mask] are the base-3 and base-4 numbers whose digit l is 1 if bit l of the 
+# 9-bit mask is set, and 0 otherwise. A region of the board with cells valued 0 (empty), 1 (X), 
+# 2 (O), and, on the large board, 3 (the cat) is indexed by the number with those digits.
+BASE3 = [sum(3 ** l for l in range(9) if mask >> l & 1) for mask in range(512)]
+BASE4 = [sum(4 ** l for l in range(9) if mask >> l & 1) for mask in range(512)]
+REGION_DIGITS = {None: 0, Player.X: 1, Player.O: 2, Player.C: 3}
+
+# POWERS_OF_3[l] is the amount by which a piece of Player X on cell l of a region increases the
+# base-3 index of the region; a piece of Player O increases it by twice as much.
+POWERS_OF_3 = [3 ** l for l in range(9)]
+
+#######################
+### Region Features ###
+#######################
+
+# The tables of the per-region features declared by the evaluation functions, each indexed by the
+# base-3 index of a sub-board. Every game state keeps the sum of each feature that has been read 
+# over its nine sub-boards, and updates the sums as moves are made, so that evaluating a state does
+# not require scanning its board. Features that are never read cost nothing.
+REGION_FEATURES = []
+
+# The tables of the features that have been read, in the order in which they were first read, and
+# the position of each of these features in that order, which is also the position of its sum in 
+# the sums of every game state.
+READ_REGION_FEATURES = []
+READ_REGION_FEATURE_SLOTS = {}
+
+def register_region_feature(table):
+    """
+    Declares a per-region feature with the provided table of 3 ** 9 values, returning the index 
+    by which its sum may be read with region_feature_sum.
+    """
+
+    REGION_FEATURES.append(table)
+    return len(REGION_FEATURES) - 1
+
+def region_feature_slot(feature):
+    """
+    Returns the position of the sum of the provided registered feature in the sums of the game 
+    states, marking the feature as read, so that the states keep its sum from now on.
+    """
+
+    slot = READ_REGION_FEATURE_SLOTS.get(feature)
+    if slot is None:
+        READ_REGION_FEATURES.append(REGION_FEATURES[feature])
+        slot = READ_REGION_FEATURE_SLOTS[feature] = len(READ_REGION_FEATURES) - 1
+    return slot
+
+def compute_region_feature_sums(region_indices, sums=()):
+    """
+    Computes the sum of every feature that has been read over the provided sub-board indices, 
+    keeping the provided sums of the features first read and computing the rest from scratch.
+    """
+
+    return list(sums) + [sum(table[index] for index in region_indices) for table in READ_REGION_FEATURES[len(sums):]]
+
+def update_region_feature_sums(sums, old_index, new_index):
+    """
+    Returns the feature sums after one sub-board changes from the old index to the new index.
+    """
+
+    return [total + table[new_index] - table[old_index] for total, table in zip(sums, READ_REGION_FEATURES)]
+
+# The legal first moves; the remaining first moves are symmetric to these.
+FIRST_ACTIONS = [(i, j) for i in range(3) for j in range(6)] + [(i, j) for i in range(3, 6) for j in range(3, 6)]
+
+# SUB_BOARD_ACTIONS[k][occupied] lists the empty cells of sub-board k, in row-major order, given
+# the 9-bit mask of its occupied cells.
+SUB_BOARD_ACTIONS = [[[BIT_CELL[k * 9 + l] for l in range(9) if not occupied >> l & 1] for occupied in range(512)] for k in range(9)]
+
+# ROW_ACTIONS[r][sbc][occupied] lists the empty cells of row r within sub-board column sbc, 
+# given the 3-bit mask of the occupied cells of that row segment.
+ROW_ACTIONS = [[[[(r, sbc * 3 + j) for j in range(3) if not occupied >> j & 1] for occupied in range(8)] for sbc in range(3)] for r in range(9)]
+
+#######################
+### Zobrist Hashing ###
+#######################
+
+# The Zobrist keys are drawn from a fixed seed so that hashes are stable across processes and 
+# may be stored on disk.
+_zobrist_random = random.Random('ultimate tic-tac-toe')
+
+# ZOBRIST_CELLS[player][b] is the key of a piece of the player on bit b.
+ZOBRIST_X = [_zobrist_random.getrandbits(64) for b in range(81)]
+ZOBRIST_O = [_zobrist_random.getrandbits(64) for b in range(81)]
+ZOBRIST_CELLS = {Player.X: ZOBRIST_X, Player.O: ZOBRIST_O}
+ZOBRIST_O_TO_MOVE = _zobrist_random.getrandbits(64)
+# ZOBRIST_TARGETS[k] is the key of being forced to play in sub-board k; the last key represents 
+# being free to play in any sub-board.
+ZOBRIST_TARGETS = [_zobrist_random.getrandbits(64) for k in range(10)]
+FREE_TARGET = 9
+
+def target_index(sub_board_score, previous_move):
+    """
+    Returns the index of the sub-board that the player to move is forced to play in, or 
+    FREE_TARGET if they may play in any sub-board.
+    """
+
+    if previous_move is None or sub_board_score[previous_move[0] % 3][previous_move[1] % 3] is not None:
+        return FREE_TARGET
+    return (previous_move[0] % 3) * 3 + previous_move[1] % 3
+
+def compute_zobrist_hash(board, sub_board_score, player_to_move, previous_move):
+    """
+    Computes the Zobrist hash of a game state from scratch.
+    """
+
+    h = ZOBRIST_TARGETS[target_index(sub_board_score, previous_move)]
+    if player_to_move == Player.O:
+        h ^= ZOBRIST_O_TO_MOVE
+    for r in range(9):
+        for c in range(9):
+            if board[r][c] in ZOBRIST_CELLS:
+                h ^= ZOBRIST_CELLS[board[r][c]][CELL_BIT[r][c]]
+    return h
+
+##################
+### Symmetries ###
+##################
+
+# The eight symmetries of the square, mapping a row and column of a grid whose last index is n. 
+# Applying a symmetry to the 9x9 board applies the same symmetry to the 3x3 arrangement of 
+# sub-boards and to the cells within each sub-board, so the forced sub-board is mapped along with 
+# the previous move.
+SYMMETRIES = [
+    lambda r, c, n: (r, c),         # Identity
+    lambda r, c, n: (c, n - r),     # Rotation by 90 degrees
+    lambda r, c, n: (n - r, n - c), # Rotation by 180 degrees
+    lambda r, c, n: (n - c, r),     # Rotation by 270 degrees
+    lambda r, c, n: (r, n - c),     # Reflection across the vertical axis
+    lambda r, c, n: (n - r, c),     # Reflection across the horizontal axis
+    lambda r, c, n: (c, r),         # Reflection across the main diagonal
+    lambda r, c, n: (n - c, n - r), # Reflection across the anti-diagonal
+]
+INVERSE_SYMMETRY = [0, 3, 2, 1, 4, 5, 6, 7]
+
+# TRANSFORMED_CELLS[t][r][c] is the cell that (r, c) is mapped to by symmetry t.
+TRANSFORMED_CELLS = [[[symmetry(r, c, 8) for c in range(9)] for r in range(9)] for symmetry in SYMMETRIES]
+# TRANSFORMED_BITS[t][b] and TRANSFORMED_SUB_BOARDS[t][k] are the bit and sub-board that bit b 
+# and sub-board k are mapped to by symmetry t.
+TRANSFORMED_BITS = [[CELL_BIT[cells[r][c][0]][cells[r][c][1]] for r, c in BIT_CELL] for cells in TRANSFORMED_CELLS]
+TRANSFORMED_SUB_BOARDS = [[symmetry(k // 3, k % 3, 2)[0] * 3 + symmetry(k // 3, k % 3, 2)[1] for k in range(9)] for symmetry in SYMMETRIES]
+
+def transform_action(action, symmetry):
+    """
+    Maps an action through the provided symmetry. To map an action of a transformed state back 
+    to the original state, use INVERSE_SYMMETRY[symmetry].
+    """
+
+    if action is None:
+        return None
+    return TRANSFORMED_CELLS[symmetry][action[0]][action[1]]
+
+# The Zobrist keys of all eight symmetric images of a state, packed into one integer such that 
+# bits [64t, 64t + 64) hold the key under symmetry t. XORing these keys maintains the hashes of 
+# all eight images at the cost of a single operation.
+HASH_MASK = (1 << 64) - 1
+
+def _pack_symmetric_keys(keys):
+    return sum(key << (64 * t) for t, key in enumerate(keys))
+
+SYMMETRIC_X = [_pack_symmetric_keys(ZOBRIST_X[TRANSFORMED_BITS[t][b]] for t in range(8)) for b in range(81)]
+SYMMETRIC_O = [_pack_symmetric_keys(ZOBRIST_O[TRANSFORMED_BITS[t][b]] for t in range(8)) for b in range(81)]
+SYMMETRIC_O_TO_MOVE = _pack_symmetric_keys([ZOBRIST_O_TO_MOVE] * 8)
+SYMMETRIC_TARGETS = [_pack_symmetric_keys(ZOBRIST_TARGETS[TRANSFORMED_SUB_BOARDS[t][k]] for t in range(8)) for k in range(9)] + [_pack_symmetric_keys([ZOBRIST_TARGETS[FREE_TARGET]] * 8)]
+
+class BitboardUltimateTicTacToe:
+    """
+    Represents a game of Ultimate Tic-Tac-Toe as a set of bitboards. The pieces of each player 
+    are stored as one 81-bit integer (a 9-bit mask per sub-board), and the scored sub-boards are 
+    stored as one 9-bit mask per player and one for the cat. This class is a drop-in replacement 
+    for UltimateTicTacToe; the board and sub_board_score attributes are provided as read-only 
+    views.
+
+    For search, moves may also be applied and reverted in place with push and pop, which avoids 
+    allocating a new state for every node. The Zobrist hashes of the state and of its seven 
+    symmetric images are maintained incrementally by both.
+    """
+
+    __slots__ = ('player_to_move', 'previous_move', '_hashes', '_x', '_o', '_x_won', '_o_won', '_cat', '_board', '_sub_board_score', '_region_feature_sums', '_history')
+
+    def __init__(self, board=None, sub_board_score=None, player_to_move=Player.X, previous_move=None):
+        self.player_to_move = player_to_move
+        self.previous_move = previous_move
+        self._x = 0
+        self._o = 0
+        self._x_won = 0
+        self._o_won = 0
+        self._cat = 0
+        self._board = None
+        self._sub_board_score = None
+        self._history = []
+
+        if board is not None:
+            for r in range(9):
+                for c in range(9):
+                    if board[r][c] == Player.X:
+                        self._x |= 1 << CELL_BIT[r][c]
+                    elif board[r][c] == Player.O:
+                        self._o |= 1 << CELL_BIT[r][c]
+
+        if sub_board_score is not None:
+            for sbr in range(3):
+                for sbc in range(3):
+                    if sub_board_score[sbr][sbc] == Player.X:
+                        self._x_won |= 1 << (sbr * 3 + sbc)
+                    elif sub_board_score[sbr][sbc] == Player.O:
+                        self._o_won |= 1 << (sbr * 3 + sbc)
+                    elif sub_board_score[sbr][sbc] == Player.C:
+                        self._cat |= 1 << (sbr * 3 + sbc)
+
+        self._hashes = SYMMETRIC_TARGETS[self._target()]
+        if player_to_move == Player.O:
+            self._hashes ^= SYMMETRIC_O_TO_MOVE
+        for b in range(81):
+            if self._x >> b & 1:
+                self._hashes ^= SYMMETRIC_X[b]
+            elif self._o >> b & 1:
+                self._hashes ^= SYMMETRIC_O[b]
+        self._region_feature_sums = compute_region_feature_sums(self.region_indices())
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Constructs a bitboard representation of any Ultimate Tic-Tac-Toe game state.
+        """
+
+        if isinstance(state, BitboardUltimateTicTacToe):
+            return state.copy()
+        return cls(board=state.board, sub_board_score=state.sub_board_score, player_to_move=state.to_move(), previous_move=state.previous_move)
+
+    def copy(self):
+        """
+        Returns an independent copy of this game state.
+        """
+
+        state = BitboardUltimateTicTacToe.__new__(BitboardUltimateTicTacToe)
+        state.player_to_move = self.player_to_move
+        state.previous_move = self.previous_move
+        state._hashes = self._hashes
+        state._x = self._x
+        state._o = self._o
+        state._x_won = self._x_won
+        state._o_won = self._o_won
+        state._cat = self._cat
+        state._board = self._board
+        state._sub_board_score = self._sub_board_score
+        state._region_feature_sums = self._region_feature_sums
+        state._history = []
+        return state
+
+    @property
+    def zobrist_hash(self):
+        """
+        The Zobrist hash of this state, matching UltimateTicTacToe.zobrist_hash.
+        """
+
+        return self._hashes & HASH_MASK
+
+    def canonical(self):
+        """
+        Returns a pair (key, symmetry), where key is the smallest Zobrist hash among the eight 
+        symmetric images of this state, and symmetry is the index of the symmetry that maps this 
+        state to that image. Symmetric states share the same key; an action found for the 
+        canonical image is mapped back with transform_action(action, INVERSE_SYMMETRY[symmetry]).
+        """
+
+        hashes = self._hashes
+        key = hashes & HASH_MASK
+        symmetry = 0
+        for t in range(1, 8):
+            h = (hashes >> (64 * t)) & HASH_MASK
+            if h < key:
+                key = h
+                symmetry = t
+        return key, symmetry
+
+    def transformed(self, symmetry):
+        """
+        Returns the image of this state under the provided symmetry.
+        """
+
+        board = [[None] * 9 for i in range(9)]
+        sub_board_score = [[None] * 3 for i in range(3)]
+        for r in range(9):
+            for c in range(9):
+                tr, tc = TRANSFORMED_CELLS[symmetry][r][c]
+                board[tr][tc] = self.board[r][c]
+        for k in range(9):
+            tk = TRANSFORMED_SUB_BOARDS[symmetry][k]
+            sub_board_score[tk // 3][tk % 3] = self.sub_board_score[k // 3][k % 3]
+        return BitboardUltimateTicTacToe(board=board, sub_board_score=sub_board_score, player_to_move=self.player_to_move, previous_move=transform_action(self.previous_move, symmetry))
+
+    @property
+    def board(self):
+        """
+        A 9x9 view of the pieces on the board, matching UltimateTicTacToe.board.
+        """
+
+        if self._board is None:
+            board = [[None] * 9 for i in range(9)]
+            for pieces, player in ((self._x, Player.X), (self._o, Player.O)):
+                # Visit only the set bits, lowest first.
+                while pieces:
+                    low = pieces & -pieces
+                    r, c = BIT_CELL[low.bit_length() - 1]
+                    board[r][c] = player
+                    pieces ^= low
+            self._board = board
+        return self._board
+
+    @property
+    def sub_board_score(self):
+        """
+        A 3x3 view of the scored sub-boards, matching UltimateTicTacToe.sub_board_score.
+        """
+
+        if self._sub_board_score is None:
+            sub_board_score = [[None] * 3 for i in range(3)]
+            for k in range(9):
+                if self._x_won >> k & 1:
+                    sub_board_score[k // 3][k % 3] = Player.X
+                elif self._o_won >> k & 1:
+                    sub_board_score[k // 3][k % 3] = Player.O
+                elif self._cat >> k & 1:
+                    sub_board_score[k // 3][k % 3] = Player.C
+            self._sub_board_score = sub_board_score
+        return self._sub_board_score
+
+    def to_move(self):
+        """
+        Returns one of Player.X or Player.O, corresponding to the player who is to move next.
+        """
+
+        return self.player_to_move
+
+    def actions(self):
+        """
+        Computes legal actions in the current state, in the same order as 
+        UltimateTicTacToe.actions.
+        """
+
+        if self.previous_move is None:
+            return list(FIRST_ACTIONS)
+
+        target = (self.previous_move[0] % 3) * 3 + self.previous_move[1] % 3
+        scored = self._x_won | self._o_won | self._cat
+        occupied = self._x | self._o
+
+        # If the forced sub-board has not been scored, the current player must move within it.
+        if not scored >> target & 1:
+            return list(SUB_BOARD_ACTIONS[target][(occupied >> (9 * target)) & FULL_SUB_BOARD])
+
+        # Otherwise, the current player may move in any empty cell of an unscored sub-board. The 
+        # cells are listed row by row to match the ordering of UltimateTicTacToe.actions.
+        actions = []
+        for r in range(9):
+            for sbc in range(3):
+                k = (r // 3) * 3 + sbc
+                if not scored >> k & 1:
+                    actions += ROW_ACTIONS[r][sbc][(occupied >> (9 * k + 3 * (r % 3))) & 7]
+        return actions
+
+    def is_valid(self, action):
+        """
+        Determines if a proposed action is valid in this state.
+        """
+
+        if action is None:
+            return False
+        r, c = action
+        if not (0 <= r <= 8 and 0 <= c <= 8):
+            return False
+        if self.previous_move is None:
+            return True
+        if ((self._x | self._o) >> CELL_BIT[r][c]) & 1:
+            return False
+
+        scored = self._x_won | self._o_won | self._cat
+        target = (self.previous_move[0] % 3) * 3 + self.previous_move[1] % 3
+
+        # If the forced sub-board is terminal, then any empty cell within an unscored sub-board is 
+        # valid. Otherwise, the move must be made within the forced sub-board.
+        if scored >> target & 1:
+            return not scored >> ((r // 3) * 3 + c // 3) & 1
+        return (r // 3) * 3 + c // 3 == target
+
+    def result(self, action):
+        """
+        Returns an instance of Ultimate Tic-Tac-Toe that represents the result of executing 
+        the supplied action on this instance. If the action is not valid, this instance is 
+        returned.
+        """
+
+        if not self.is_valid(action):
+            return self
+
+        state = self.copy()
+        state._play(action)
+        return state
+
+    def push(self, action):
+        """
+        Executes the supplied action on this instance in place, such that it can be reverted by
+        pop. The action is assumed to be one of the legal actions in this state.
+        """
+
+        # The sums of features first read in a later state are completed here rather than in _play,
+        # so that pop restores them, and they are not computed again after every pop.
+        if len(self._region_feature_sums) != len(READ_REGION_FEATURES):
+            self._region_feature_sums = compute_region_feature_sums(self.region_indices(), self._region_feature_sums)
+        self._history.append((self._x, self._o, self._x_won, self._o_won, self._cat, self.previous_move, self._hashes, self._region_feature_sums))
+        self._play(action)
+
+    def pop(self):
+        """
+        Reverts the action most recently executed by push.
+        """
+
+        self._x, self._o, self._x_won, self._o_won, self._cat, self.previous_move, self._hashes, self._region_feature_sums = self._history.pop()
+        self.player_to_move = Player.O if self.player_to_move is Player.X else Player.X
+        self._board = None
+        self._sub_board_score = None
+
+    def _play(self, action):
+        """
+        Executes the supplied (valid) action on this instance in place.
+        """
+
+        r, c = action
+        b = CELL_BIT[r][c]
+        k = b // 9
+        shift = 9 * k
+        h = self._hashes ^ SYMMETRIC_O_TO_MOVE ^ SYMMETRIC_TARGETS[self._target()]
+
+        # The feature sums are replaced rather than updated in place, since copies and the history 
+        # of push share them.
+        if READ_REGION_FEATURES:
+            if len(self._region_feature_sums) != len(READ_REGION_FEATURES):
+                self._region_feature_sums = compute_region_feature_sums(self.region_indices(), self._region_feature_sums)
+            old_index = BASE3[(self._x >> shift) & FULL_SUB_BOARD] + 2 * BASE3[(self._o >> shift) & FULL_SUB_BOARD]
+            new_index = old_index + POWERS_OF_3[b % 9] * (1 if self.player_to_move is Player.X else 2)
+            self._region_feature_sums = update_region_feature_sums(self._region_feature_sums, old_index, new_index)
+
+        if self.player_to_move is Player.X:
+            self._x |= 1 << b
+            h ^= SYMMETRIC_X[b]
+            if self.previous_move is not None:
+                if WINS[(self._x >> shift) & FULL_SUB_BOARD]:
+                    self._x_won |= 1 << k
+                elif ((self._x | self._o) >> shift) & FULL_SUB_BOARD == FULL_SUB_BOARD:
+                    self._cat |= 1 << k
+            self.player_to_move = Player.O
+        else:
+            self._o |= 1 << b
+            h ^= SYMMETRIC_O[b]
+            if self.previous_move is not None:
+                if WINS[(self._o >> shift) & FULL_SUB_BOARD]:
+                    self._o_won |= 1 << k
+                elif ((self._x | self._o) >> shift) & FULL_SUB_BOARD == FULL_SUB_BOARD:
+                    self._cat |= 1 << k
+            self.player_to_move = Player.X
+
+        # The next player is forced into the sub-board matching the cell just played, unless it 
+        # has been scored.
+        target = b % 9
+        if (self._x_won | self._o_won | self._cat) >> target & 1:
+            target = FREE_TARGET
+
+        self._hashes = h ^ SYMMETRIC_TARGETS[target]
+        self.previous_move = action
+        self._board = None
+        self._sub_board_score = None
+
+    def _target(self):
+        """
+        Returns the index of the sub-board that the player to move is forced to play in, or 
+        FREE_TARGET if they may play in any sub-board.
+        """
+
+        if self.previous_move is None:
+            return FREE_TARGET
+        target = (self.previous_move[0] % 3) * 3 + self.previous_move[1] % 3
+        if (self._x_won | self._o_won | self._cat) >> target & 1:
+            return FREE_TARGET
+        return target
+
+    def region_indices(self):
+        """
+        Returns the base-3 index of each sub-board (see BASE3), in row-major order.
+        """
+
+        x = self._x
+        o = self._o
+        return [BASE3[(x >> shift) & FULL_SUB_BOARD] + 2 * BASE3[(o >> shift) & FULL_SUB_BOARD] for shift in range(0, 81, 9)]
+
+    def region_feature_sum(self, feature):
+        """
+        Returns the sum of the registered feature (see register_region_feature) over all 
+        sub-boards.
+        """
+
+        slot = region_feature_slot(feature)
+        if slot >= len(self._region_feature_sums):
+            self._region_feature_sums = compute_region_feature_sums(self.region_indices(), self._region_feature_sums)
+        return self._region_feature_sums[slot]
+
+    def big_board_index(self):
+        """
+        Returns the base-4 index of the sub-board scores (see BASE4).
+        """
+
+        return BASE4[self._x_won] + 2 * BASE4[self._o_won] + 3 * BASE4[self._cat]
+
+    def wins_sub_board(self, action):
+        """
+        Determines if the supplied (valid) action would win its sub-board for the player to move.
+        """
+
+        b = CELL_BIT[action[0]][action[1]]
+        pieces = self._x if self.player_to_move is Player.X else self._o
+        return self.previous_move is not None and WINS[((pieces | 1 << b) >> (9 * (b // 9))) & FULL_SUB_BOARD]
+
+    def frees_opponent(self, action):
+        """
+        Determines if the supplied (valid) action would send the opponent to a scored sub-board, 
+        leaving them free to play in any sub-board.
+        """
+
+        b = CELL_BIT[action[0]][action[1]]
+        k = b // 9
+        target = b % 9
+        if (self._x_won | self._o_won | self._cat) >> target & 1:
+            return True
+        # An action that sends the opponent to its own sub-board frees them if it scores it.
+        return target == k and self.previous_move is not None and (self.wins_sub_board(action) or ((self._x | self._o | 1 << b) >> (9 * k)) & FULL_SUB_BOARD == FULL_SUB_BOARD)
+
+    def masks(self):
+        """
+        Returns a triple (x, o, target) that determines this state: the 81-bit masks of the 
+        pieces of Player X and Player O (see CELL_BIT), and the sub-board that the player to move 
+        is forced to play in, or FREE_TARGET.
+        """
+
+        return self._x, self._o, self._target()
+
+    def open_cells(self):
+        """
+        Counts the empty cells within sub-boards that have not been scored.
+        """
+
+        scored = self._x_won | self._o_won | self._cat
+        occupied = self._x | self._o
+        return sum(9 - ((occupied >> (9 * k)) & FULL_SUB_BOARD).bit_count() for k in range(9) if not scored >> k & 1)
+
+    def is_terminal(self):
+        """
+        Determines if this instance of Ultimate Tic-Tac-Toe represents a terminal game state.
+        """
+
+        if self.previous_move is None:
+            return False
+
+        # Only the sub-board played in most-recently can have ended the game.
+        k = (self.previous_move[0] // 3) * 3 + self.previous_move[1] // 3
+        if self._x_won >> k & 1:
+            if WINS_THROUGH[k][self._x_won]:
+                return True
+        elif self._o_won >> k & 1:
+            if WINS_THROUGH[k][self._o_won]:
+                return True
+        elif not self._cat >> k & 1:
+            return False
+
+        return self._x_won | self._o_won | self._cat == FULL_SUB_BOARD
+
+    def utility(self):
+        """
+        Computes the utility of this game state.
+        """
+
+        if not self.is_terminal():
+            raise Exception("Cannot compute the utility of a non-terminal game state!")
+
+        k = (self.previous_move[0] // 3) * 3 + self.previous_move[1] // 3
+        if (self._x_won >> k & 1 and WINS_THROUGH[k][self._x_won]) or (self._o_won >> k & 1 and WINS_THROUGH[k][self._o_won]):
+            return 100 if self.player_to_move == Player.O else -100
+        return 0
+
+    __str__ = UltimateTicTacToe.__str__
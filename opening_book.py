@@ -0,0 +1,165 @@
+import functools
+import multiprocessing
+import optparse
+import os
+import struct
+import sys
+import time
+
+from model import BIT_CELL
+from model import BitboardUltimateTicTacToe
+from model import CELL_BIT
+from model import INVERSE_SYMMETRY
+from model import transform_action
+
+####################
+### Opening Book ###
+####################
+
+# A book file begins with a header of the magic bytes and the number of entries, followed by the
+# entries sorted by key. Each entry is the canonical key of a position (see
+# BitboardUltimateTicTacToe.canonical) and the bit of the best move in the canonical image of the
+# position (see CELL_BIT).
+BOOK_MAGIC = b'UTTTBOOK'
+BOOK_HEADER = struct.Struct('<8sI')
+BOOK_ENTRY = struct.Struct('<QB')
+
+class OpeningBook():
+    """
+    A table of the best moves of opening positions, keyed by the canonical key of the position,
+    so that all symmetric images of a position share one entry. Moves are stored relative to the
+    canonical image and mapped back to the position on lookup.
+    """
+
+    def __init__(self, moves=None):
+        self.moves = moves if moves is not None else {}
+
+    def __len__(self):
+        return len(self.moves)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an opening book from the file at the provided path.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < BOOK_HEADER.size:
+            raise Exception('The file ' + path + ' is not an opening book!')
+        magic, count = BOOK_HEADER.unpack_from(data)
+        if magic != BOOK_MAGIC or len(data) != BOOK_HEADER.size + count * BOOK_ENTRY.size:
+            raise Exception('The file ' + path + ' is not an opening book!')
+        return cls(dict(BOOK_ENTRY.iter_unpack(data[BOOK_HEADER.size:])))
+
+    def save(self, path):
+        """
+        Writes this opening book to the file at the provided path. The file is replaced
+        atomically, so that a reader never sees a partially written book.
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(BOOK_HEADER.pack(BOOK_MAGIC, len(self.moves)))
+            for key in sorted(self.moves):
+                f.write(BOOK_ENTRY.pack(key, self.moves[key]))
+        os.replace(temporary_path, path)
+
+    def add(self, state, action):
+        """
+        Records the action as the best move of the provided bitboard state.
+        """
+        key, symmetry = state.canonical()
+        canonical_action = transform_action(action, symmetry)
+        self.moves[key] = CELL_BIT[canonical_action[0]][canonical_action[1]]
+
+    def lookup(self, state):
+        """
+        Returns the best move recorded for the provided bitboard state, or None if the state is
+        not in the book.
+        """
+        key, symmetry = state.canonical()
+        bit = self.moves.get(key)
+        if bit is None:
+            return None
+        action = transform_action(BIT_CELL[bit], INVERSE_SYMMETRY[symmetry])
+        # A hash collision could yield an illegal move, which is better left to the search.
+        return action if action in state.actions() else None
+
+################
+### Building ###
+################
+
+def book_positions(plies):
+    """
+    Returns the distinct (up to symmetry) non-terminal positions that can be reached within
+    fewer than the provided number of plies from the empty board.
+    """
+    positions = []
+    seen = set()
+    frontier = [BitboardUltimateTicTacToe()]
+    for ply in range(plies):
+        next_frontier = []
+        for state in frontier:
+            key = state.canonical()[0]
+            if key in seen or state.is_terminal():
+                continue
+            seen.add(key)
+            positions.append(state)
+            if ply + 1 < plies:
+                next_frontier += [state.result(action) for action in state.actions()]
+        frontier = next_frontier
+    return positions
+
+def search_position(agent_options, state):
+    """
+    Returns the best move of the provided state, as found by a newly loaded agent, so that the
+    result does not depend on the positions searched before it.
+    """
+    from game import load_agent
+    agent = load_agent(agent_options)
+    try:
+        return agent.getAction(state)
+    finally:
+        agent.close()
+
+def build_book(agent_options, plies, jobs=1):
+    """
+    Searches every opening position within the provided number of plies with the agent
+    described by the options (as for game.load_agent), across a pool of processes if more than
+    one job is requested, and returns the resulting OpeningBook.
+    """
+    positions = book_positions(plies)
+    search = functools.partial(search_position, agent_options)
+    book = OpeningBook()
+
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            actions = pool.map(search, positions)
+    else:
+        actions = map(search, positions)
+
+    for state, action in zip(positions, actions):
+        book.add(state, action)
+    return book
+
+def read_command(argv):
+    parser = optparse.OptionParser(description="Build an opening book of Ultimate Tic-Tac-Toe by searching every opening position")
+
+    parser.add_option('-f', dest='file', help='the file to write the book to', default='book.bin')
+    parser.add_option('-k', dest='plies', type='int', help='the number of plies from the empty board covered by the book', default=2)
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', help='number of positions to search in parallel', default=1)
+    parser.add_option('-a', dest='type', help='the agent type that searches the positions', default='PVSAgent')
+    parser.add_option('-e', dest='evaluation_function', help='the evaluation function of the agent', default='deep_simple_evaluation')
+    parser.add_option('-d', dest='depth', type='int', help='the search depth of the agent', default=8)
+    parser.add_option('-t', dest='time_limit', type='int', help='the time limit per position in milliseconds (overrides the search depth)')
+
+    options, _ = parser.parse_args(argv)
+    return options
+
+if __name__ == '__main__':
+    options = read_command(sys.argv)
+    agent_options = {'type': options.type, 'evaluation_function': options.evaluation_function, 'depth': options.depth, 'time_limit': options.time_limit}
+
+    start = time.perf_counter()
+    book = build_book(agent_options, options.plies, options.jobs)
+    book.save(options.file)
+    print(f'Wrote {len(book)} positions to {options.file} in {time.perf_counter() - start:.1f} seconds')
@@ -0,0 +1,132 @@
+import json
+import optparse
+import sys
+import time
+
+from model import BitboardUltimateTicTacToe
+from model import UltimateTicTacToe
+
+#################
+### Positions ###
+#################
+
+# The stored positions, as the moves that lead to them from the empty board, with the reference
+# leaf counts of each depth. The counts were computed with every implementation below, which all
+# agreed.
+POSITIONS = {
+    'start': ([], {1: 27, 2: 240, 3: 2112, 4: 18360, 5: 157752, 6: 1340448}),
+    'opening': ([(4, 4), (3, 5), (2, 7), (6, 5), (2, 6), (7, 0), (5, 1), (6, 3), (2, 0), (7, 2)], {1: 9, 2: 70, 3: 542, 4: 4259, 5: 33407}),
+    'middlegame': ([(1, 3), (4, 1), (5, 3), (6, 2), (2, 7), (7, 3), (4, 2), (4, 7), (3, 4), (1, 4), (5, 4), (6, 3), (0, 2), (0, 6), (0, 1), (0, 5), (1, 7), (4, 4), (4, 3), (3, 2), (0, 7), (0, 3), (1, 0), (4, 0)], {1: 5, 2: 35, 3: 359, 4: 4021, 5: 44355}),
+    'free-move': ([(2, 5), (7, 7), (4, 5), (3, 7), (2, 3), (6, 1), (0, 4), (1, 4), (3, 3), (1, 2), (5, 7), (8, 3), (7, 0), (4, 1), (4, 3), (4, 0), (5, 1), (6, 3), (1, 1), (5, 5), (7, 8), (4, 7), (5, 4), (7, 4), (4, 4), (2, 8), (7, 6), (3, 2), (0, 8), (1, 7)], {1: 48, 2: 327, 3: 2191, 4: 15102, 5: 107458}),
+    'late-middlegame': ([(1, 4), (4, 5), (4, 7), (5, 5), (8, 7), (8, 5), (6, 6), (2, 2), (8, 6), (7, 1), (4, 4), (3, 3), (2, 1), (8, 3), (8, 0), (6, 1), (1, 3), (3, 2), (1, 8), (3, 8), (0, 8), (2, 6), (7, 2), (5, 7), (7, 3), (3, 1), (0, 5), (1, 6), (4, 0), (4, 1), (5, 3), (6, 2), (0, 7), (0, 3), (0, 1), (2, 5), (7, 6), (5, 1), (6, 3), (0, 2)], {1: 4, 2: 42, 3: 453, 4: 4658, 5: 47664}),
+    'endgame': ([(2, 3), (7, 2), (5, 8), (7, 6), (3, 0), (2, 1), (6, 5), (1, 7), (4, 4), (5, 4), (7, 4), (4, 3), (4, 2), (3, 7), (2, 5), (8, 8), (8, 6), (7, 1), (5, 5), (8, 7), (7, 5), (4, 7), (3, 4), (2, 4), (8, 3), (6, 2), (2, 6), (8, 1), (5, 6), (6, 0), (2, 2), (7, 7), (3, 5), (0, 6), (0, 1), (0, 4), (0, 5), (0, 8), (1, 8), (3, 8), (1, 6), (4, 0), (5, 0), (6, 1), (1, 5), (4, 8), (4, 6), (3, 1), (1, 2), (3, 6), (0, 0), (2, 0), (6, 6), (1, 0), (4, 1)], {1: 3, 2: 28, 3: 159, 4: 955, 5: 4568}),
+}
+
+#############
+### Perft ###
+#############
+
+def perft(state, depth):
+    """
+    Counts the positions reached by every sequence of 'depth' legal moves from the provided
+    state, creating each successor with result. Games that end before the depth is reached
+    contribute no positions. Every leaf is created, so that the count exercises the whole move
+    generator.
+    """
+    if depth == 0:
+        return 1
+    if state.is_terminal():
+        return 0
+    return sum(perft(state.result(action), depth - 1) for action in state.actions())
+
+def perft_push(state, depth):
+    """
+    Counts the same positions as perft, applying and reverting each move in place with push and
+    pop.
+    """
+    if depth == 0:
+        return 1
+    if state.is_terminal():
+        return 0
+    nodes = 0
+    for action in state.actions():
+        state.push(action)
+        nodes += perft_push(state, depth - 1)
+        state.pop()
+    return nodes
+
+# The implementations of the move generator, as pairs (state class, perft function).
+IMPLEMENTATIONS = {
+    'UltimateTicTacToe': (UltimateTicTacToe, perft),
+    'BitboardUltimateTicTacToe': (BitboardUltimateTicTacToe, perft),
+    'BitboardUltimateTicTacToe.push': (BitboardUltimateTicTacToe, perft_push),
+}
+
+def load_position(state_class, moves):
+    """
+    Constructs the position reached by the provided moves from the empty board.
+    """
+    state = state_class()
+    for move in moves:
+        if move not in state.actions():
+            raise Exception('The move ' + str(move) + ' is not legal in\n' + str(state))
+        state = state.result(move)
+    return state
+
+def run_perft(position_names, implementation_names, depth):
+    """
+    Counts the leaves of every stored position to every depth up to the provided depth, with
+    every implementation, and returns a list of records, one per count. A count is correct if it
+    equals the reference count of the position (when there is one) and the counts of the other
+    implementations.
+    """
+    records = []
+    for name in position_names:
+        moves, references = POSITIONS[name]
+        for d in range(1, depth + 1):
+            counts = []
+            for implementation in implementation_names:
+                state_class, function = IMPLEMENTATIONS[implementation]
+                state = load_position(state_class, moves)
+                start = time.perf_counter()
+                nodes = function(state, d)
+                seconds = time.perf_counter() - start
+                counts.append(nodes)
+                records.append({
+                    'position': name,
+                    'implementation': implementation,
+                    'depth': d,
+                    'nodes': nodes,
+                    'expected': references.get(d),
+                    'seconds': seconds,
+                    'nodes_per_second': nodes / seconds if seconds > 0 else None,
+                })
+            for record in records[-len(counts):]:
+                record['ok'] = (record['expected'] is None or record['nodes'] == record['expected']) and len(set(counts)) == 1
+    return records
+
+def read_command(argv):
+    parser = optparse.OptionParser(description="Count the leaf nodes of the move generator of Ultimate Tic-Tac-Toe")
+
+    parser.add_option('-d', dest='depth', type='int', help='the maximum depth to count to', default=4)
+    parser.add_option('-p', dest='positions', help='a comma-separated list of stored positions (' + ', '.join(POSITIONS) + ')', default=','.join(POSITIONS))
+    parser.add_option('-i', dest='implementations', help='a comma-separated list of implementations (' + ', '.join(IMPLEMENTATIONS) + ')', default=','.join(IMPLEMENTATIONS))
+    parser.add_option('--json', dest='json', action='store_true', help='print one JSON record per count', default=False)
+
+    options, _ = parser.parse_args(argv)
+    return options
+
+if __name__ == '__main__':
+    options = read_command(sys.argv)
+    records = run_perft(options.positions.split(','), options.implementations.split(','), options.depth)
+
+    for record in records:
+        if options.json:
+            print(json.dumps(record))
+        else:
+            nodes_per_second = f'{record["nodes_per_second"]:.0f}' if record['nodes_per_second'] is not None else '-'
+            print(f'{record["position"]:<17}{record["implementation"]:<32}{record["depth"]:>3}{record["nodes"]:>12}{nodes_per_second:>12} nps  {"ok" if record["ok"] else "MISMATCH (expected " + str(record["expected"]) + ")"}')
+
+    # Exit with a failure status if any count is incorrect, so that the tool can serve as a test.
+    if not all(record['ok'] for record in records):
+        sys.exit(1)
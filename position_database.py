@@ -0,0 +1,278 @@
+import functools
+import heapq
+import itertools
+import mmap
+import multiprocessing
+import optparse
+import os
+import struct
+import sys
+import time
+
+from model import BIT_CELL
+from model import CELL_BIT
+from model import FREE_TARGET
+from model import INVERSE_SYMMETRY
+from model import TRANSFORMED_BITS
+from model import TRANSFORMED_SUB_BOARDS
+from model import transform_action
+
+#########################
+### Position Encoding ###
+#########################
+
+# A position is packed as its board: the 81-bit masks of the pieces of Player X and Player O
+# (laid out as the bits of BitboardUltimateTicTacToe), 11 little-endian bytes each, followed by
+# the sub-board that the player to move is forced to play in (or FREE_TARGET). The board fixes
+# the rest of the position, including the player to move. Positions are always packed as their
+# canonical image (see BitboardUltimateTicTacToe.canonical), so that symmetric positions share
+# one record.
+BOARD_SIZE = 23
+
+def transform_pieces(pieces, symmetry):
+    """
+    Returns the image of the provided 81-bit mask of pieces under the provided symmetry.
+    """
+    bits = TRANSFORMED_BITS[symmetry]
+    image = 0
+    while pieces:
+        low = pieces & -pieces
+        image |= 1 << bits[low.bit_length() - 1]
+        pieces ^= low
+    return image
+
+def encode_position(state):
+    """
+    Returns a pair (board, symmetry), where board is the packed board of the canonical image of
+    the provided bitboard state, and symmetry is the index of the symmetry that maps the state
+    to that image.
+    """
+    symmetry = state.canonical()[1]
+    x, o, target = state.masks()
+    x = transform_pieces(x, symmetry)
+    o = transform_pieces(o, symmetry)
+    if target != FREE_TARGET:
+        target = TRANSFORMED_SUB_BOARDS[symmetry][target]
+    return x.to_bytes(11, 'little') + o.to_bytes(11, 'little') + bytes([target]), symmetry
+
+###############
+### Records ###
+###############
+
+# A database file begins with a header of the magic bytes and the number of records, followed
+# by fixed-size records sorted by board. Each record is a packed board, the bit of the best move
+# in the board (see CELL_BIT), the score of the move (as a MiniMax utility, from the perspective
+# of Player X, or NaN if it is not known), and the depth of the search that found it. Records
+# are read in place as tuples (board, move, score, depth).
+DATABASE_MAGIC = b'UTTTPOSD'
+DATABASE_HEADER = struct.Struct('<8sQ')
+DATABASE_RECORD = struct.Struct(f'<{BOARD_SIZE}sBfB')
+
+def make_record(state, action, score, depth):
+    """
+    Returns the record of the provided action, found by a search of the provided depth to have
+    the provided score, as the best move of the provided bitboard state.
+    """
+    board, symmetry = encode_position(state)
+    canonical_action = transform_action(action, symmetry)
+    return board, CELL_BIT[canonical_action[0]][canonical_action[1]], float('nan') if score is None else score, depth
+
+class PositionDatabase():
+    """
+    A read-only view of a database file, which is memory-mapped rather than read, so that
+    records are unpacked only when they are looked up, opening a database costs nothing however
+    large it is, and every process that opens the same file shares one copy of it in memory.
+    Positions are found by binary search over the sorted records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if size < DATABASE_HEADER.size:
+                raise Exception('The file ' + path + ' is not a position database!')
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+        magic, self.count = DATABASE_HEADER.unpack_from(self.mmap)
+        if magic != DATABASE_MAGIC or size != DATABASE_HEADER.size + self.count * DATABASE_RECORD.size:
+            self.close()
+            raise Exception('The file ' + path + ' is not a position database!')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return DATABASE_RECORD.unpack_from(self.mmap, DATABASE_HEADER.size + index * DATABASE_RECORD.size)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def board(self, index):
+        """
+        Returns the packed board of the record at the provided index.
+        """
+        offset = DATABASE_HEADER.size + index * DATABASE_RECORD.size
+        return self.mmap[offset:offset + BOARD_SIZE]
+
+    def find(self, board):
+        """
+        Returns the record of the provided packed board, or None if there is none.
+        """
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.board(middle) < board:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.board(low) == board:
+            return self[low]
+        return None
+
+    def lookup(self, state):
+        """
+        Returns a triple (action, score, depth) of the best move recorded for the provided
+        bitboard state, or None if the state is not in the database.
+        """
+        board, symmetry = encode_position(state)
+        record = self.find(board)
+        if record is None:
+            return None
+        return transform_action(BIT_CELL[record[1]], INVERSE_SYMMETRY[symmetry]), record[2], record[3]
+
+###########################
+### Writing and Merging ###
+###########################
+
+def merge_records(*sources):
+    """
+    Merges iterables of records, each sorted by board, into one sorted iterable with one record
+    per board: the record of the deepest search, or of the last source among equally deep ones.
+    """
+    merged = heapq.merge(*sources, key=lambda record: record[0])
+    for board, group in itertools.groupby(merged, key=lambda record: record[0]):
+        best = None
+        for record in group:
+            if best is None or record[3] >= best[3]:
+                best = record
+        yield best
+
+def write_database(path, records):
+    """
+    Writes the provided records, which must be sorted by board with one record per board, to a
+    database file at the provided path. The records are streamed rather than held in memory, and
+    the file is replaced atomically, so that processes that have the previous file open keep
+    reading it undisturbed. Returns the number of records written.
+    """
+    temporary_path = path + '.tmp'
+    count = 0
+    with open(temporary_path, 'wb') as f:
+        f.write(DATABASE_HEADER.pack(DATABASE_MAGIC, 0))
+        for record in records:
+            f.write(DATABASE_RECORD.pack(*record))
+            count += 1
+        f.seek(0)
+        f.write(DATABASE_HEADER.pack(DATABASE_MAGIC, count))
+    os.replace(temporary_path, path)
+    return count
+
+def append_records(path, records):
+    """
+    Adds the provided records, in any order, to the database file at the provided path (which is
+    created if it does not exist), replacing the records of the same boards unless they come from
+    deeper searches. Returns the number of records in the resulting database.
+    """
+    records = sorted(records, key=lambda record: record[0])
+    if not os.path.exists(path):
+        return write_database(path, merge_records(records))
+    with PositionDatabase(path) as database:
+        return write_database(path, merge_records(database, records))
+
+def merge_databases(path, input_paths):
+    """
+    Merges the database files at the provided input paths into one database file at the provided
+    path, which may be one of the inputs. Returns the number of records in the result.
+    """
+    databases = [PositionDatabase(input_path) for input_path in input_paths]
+    try:
+        return write_database(path, merge_records(*databases))
+    finally:
+        for database in databases:
+            database.close()
+
+################
+### Analysis ###
+################
+
+def analyze_position(agent_options, state):
+    """
+    Returns the record of the best move of the provided bitboard state, as found by a newly
+    loaded agent (see opening_book.search_position).
+    """
+    from game import load_agent
+    agent = load_agent(agent_options)
+    try:
+        action = agent.getAction(state)
+        return make_record(state, action, agent.stats.score, agent.stats.depth)
+    finally:
+        agent.close()
+
+def analyze_positions(agent_options, states, jobs=1):
+    """
+    Analyzes every provided state with the agent described by the options (as for
+    game.load_agent), across a pool of processes if more than one job is requested, and returns
+    the list of the resulting records.
+    """
+    analyze = functools.partial(analyze_position, agent_options)
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            return pool.map(analyze, states)
+    return list(map(analyze, states))
+
+def read_command(argv):
+    parser = optparse.OptionParser(usage='%prog [options] [DATABASE...]', description="Build a database of analyzed Ultimate Tic-Tac-Toe positions, by searching every opening position and adding the results to the database, and by merging other databases into it")
+
+    parser.add_option('-f', dest='file', help='the database file to add to', default='positions.bin')
+    parser.add_option('-k', dest='plies', type='int', help='the number of plies from the empty board to analyze (0 to only merge)', default=0)
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', help='number of positions to analyze in parallel', default=1)
+    parser.add_option('-a', dest='type', help='the agent type that analyzes the positions', default='PVSAgent')
+    parser.add_option('-e', dest='evaluation_function', help='the evaluation function of the agent', default='deep_simple_evaluation')
+    parser.add_option('-d', dest='depth', type='int', help='the search depth of the agent', default=8)
+    parser.add_option('-t', dest='time_limit', type='int', help='the time limit per position in milliseconds (overrides the search depth)')
+
+    options, args = parser.parse_args(argv)
+    return options, args[1:]
+
+if __name__ == '__main__':
+    options, input_paths = read_command(sys.argv)
+    start = time.perf_counter()
+
+    if input_paths:
+        if os.path.exists(options.file):
+            input_paths = [options.file] + input_paths
+        count = merge_databases(options.file, input_paths)
+        print(f'Merged {len(input_paths)} databases into {count} positions in {options.file}')
+
+    if options.plies > 0:
+        from opening_book import book_positions
+        agent_options = {'type': options.type, 'evaluation_function': options.evaluation_function, 'depth': options.depth, 'time_limit': options.time_limit}
+        records = analyze_positions(agent_options, book_positions(options.plies), options.jobs)
+        count = append_records(options.file, records)
+        print(f'Analyzed {len(records)} positions; {options.file} holds {count} positions')
+
+    print(f'Finished in {time.perf_counter() - start:.1f} seconds')
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import evaluation_functions
+
+from model import BitboardUltimateTicTacToe
+from model import UltimateTicTacToe
+
+# The methods of the game states that are profiled, as pairs (class, method name).
+PROFILED_METHODS = [
+    (UltimateTicTacToe, 'actions'),
+    (UltimateTicTacToe, 'result'),
+    (UltimateTicTacToe, 'is_terminal'),
+    (UltimateTicTacToe, 'contains_win'),
+    (UltimateTicTacToe, 'no_none'),
+    (BitboardUltimateTicTacToe, 'actions'),
+    (BitboardUltimateTicTacToe, 'result'),
+    (BitboardUltimateTicTacToe, 'push'),
+    (BitboardUltimateTicTacToe, 'pop'),
+    (BitboardUltimateTicTacToe, 'is_terminal'),
+]
+
+################
+### Profiler ###
+################
+
+class Profiler():
+    """
+    Times and counts the calls of the functions that it instruments. Calls are recorded by their
+    stack of instrumented functions, so that the time spent within each function is attributed
+    to its callers; records maps each stack (a tuple of labels, outermost first) to a list
+    [calls, total seconds, self seconds], where the self time excludes the time spent in nested
+    instrumented calls. Each thread keeps its own stack, so that the calls made by the thread of a
+    pondering agent are recorded as stacks of their own, outside of either agent's getAction.
+
+    Functions are instrumented by replacing them where they are defined, and restored by
+    uninstall; nothing is replaced unless the profiler is installed, so profiling costs nothing
+    when it is disabled.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.threads = threading.local()
+        self.replaced = []
+
+    def wrap(self, function, label):
+        """
+        Returns a function that calls the provided function, recording the call under the label.
+        """
+        records = self.records
+        threads = self.threads
+        clock = time.perf_counter
+
+        def profiled(*args, **kwargs):
+            if not hasattr(threads, 'stack'):
+                threads.stack = []
+                threads.child_times = []
+            stack = threads.stack
+            child_times = threads.child_times
+            stack.append(label)
+            child_times.append(0.0)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                key = tuple(stack)
+                record = records.get(key)
+                if record is None:
+                    record = records.setdefault(key, [0, 0.0, 0.0])
+                record[0] += 1
+                record[1] += elapsed
+                record[2] += elapsed - child_times.pop()
+                stack.pop()
+                if child_times:
+                    child_times[-1] += elapsed
+
+        return profiled
+
+    def instrument(self, owner, name, label):
+        """
+        Replaces the attribute of the owner (a class or module) with the provided name by a
+        profiled version of it, until uninstall is called.
+        """
+        original = vars(owner)[name]
+        if isinstance(original, staticmethod):
+            replacement = staticmethod(self.wrap(original.__func__, label))
+        else:
+            replacement = self.wrap(original, label)
+        setattr(owner, name, replacement)
+        self.replaced.append((owner, name, original))
+
+    def install(self, evaluation_function_names=()):
+        """
+        Instruments the methods of the game states in PROFILED_METHODS and the evaluation
+        functions with the provided names. The evaluation functions must be instrumented before
+        the agents that use them are loaded.
+        """
+        for owner, name in PROFILED_METHODS:
+            self.instrument(owner, name, f'{owner.__name__}.{name}')
+        for name in sorted(set(evaluation_function_names)):
+            if name in dir(evaluation_functions):
+                self.instrument(evaluation_functions, name, f'evaluation_functions.{name}')
+
+    def uninstall(self):
+        """
+        Restores every instrumented function.
+        """
+        while self.replaced:
+            owner, name, original = self.replaced.pop()
+            setattr(owner, name, original)
+
+def merge_records(records, other):
+    """
+    Adds the records of another profile to the provided records.
+    """
+    for key, (calls, total, self_time) in other.items():
+        record = records.setdefault(key, [0, 0.0, 0.0])
+        record[0] += calls
+        record[1] += total
+        record[2] += self_time
+
+##############
+### Output ###
+##############
+
+def write_collapsed(records, file):
+    """
+    Writes the records as collapsed stacks, one line per stack with its self time in
+    microseconds, as read by flame graph tools.
+    """
+    for key in sorted(records):
+        print(f'{";".join(key)} {round(records[key][2] * 1e6)}', file=file)
+
+def write_histogram(records, file):
+    """
+    Writes a table of the calls, total time, and self time of every profiled function, most
+    expensive first. The total time of a function excludes its recursive calls.
+    """
+    functions = {}
+    for key, (calls, total, self_time) in records.items():
+        label = key[-1]
+        function = functions.setdefault(label, [0, 0.0, 0.0])
+        function[0] += calls
+        if label not in key[:-1]:
+            function[1] += total
+        function[2] += self_time
+
+    total_self_time = sum(function[2] for function in functions.values())
+    print(f'{"function":<40}{"calls":>12}{"total (s)":>12}{"self (s)":>12}{"self %":>9}{"per call (us)":>15}', file=file)
+    for label, (calls, total, self_time) in sorted(functions.items(), key=lambda item: item[1][2], reverse=True):
+        share = self_time / total_self_time if total_self_time > 0 else 0
+        print(f'{label:<40}{calls:>12}{total:>12.3f}{self_time:>12.3f}{share:>9.1%}{total / calls * 1e6:>15.2f}', file=file)
@@ -0,0 +1,206 @@
+import functools
+import json
+import multiprocessing
+import optparse
+import os
+import random
+import struct
+import sys
+import time
+
+from game import add_agent_options
+from game import derive_options
+from game import load_agent
+from game import split_options
+from model import BitboardUltimateTicTacToe
+from model import Player
+
+###############
+### Samples ###
+###############
+
+# A dataset is a directory of chunk files, each holding the positions of a fixed range of games,
+# together with the settings that generated it. A chunk file begins with a header of the magic
+# bytes, the index of its first game, its number of games, and its number of samples, followed
+# by the samples. Each sample is a position before a move: the 81-bit masks of the pieces of
+# Player X and Player O (see CELL_BIT), 11 little-endian bytes each, the player to move (1 for
+# Player X, -1 for Player O), the sub-board that the player to move is forced to play in (or
+# FREE_TARGET), the score of the position according to the search of the player to move (as a
+# MiniMax utility, from the perspective of Player X, or NaN if it did not search), and the final
+# outcome of the game (1 if Player X won, -1 if Player O won, and 0 for a tie).
+CHUNK_MAGIC = b'UTTTSELF'
+CHUNK_HEADER = struct.Struct('<8sIII')
+SAMPLE = struct.Struct('<11s11sbBfb')
+
+SETTINGS_FILE = 'settings.json'
+
+def chunk_path(directory, chunk):
+    return os.path.join(directory, f'chunk-{chunk:06d}.bin')
+
+def read_chunk(path):
+    """
+    Reads the chunk file at the provided path, returning a triple (first_game, num_games,
+    samples), where samples is a list of tuples (x, o, player, target, score, outcome), with the
+    masks of pieces as integers.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < CHUNK_HEADER.size:
+        raise Exception('The file ' + path + ' is not a self-play chunk!')
+    magic, first_game, num_games, num_samples = CHUNK_HEADER.unpack_from(data)
+    if magic != CHUNK_MAGIC or len(data) != CHUNK_HEADER.size + num_samples * SAMPLE.size:
+        raise Exception('The file ' + path + ' is not a self-play chunk!')
+    samples = [(int.from_bytes(x, 'little'), int.from_bytes(o, 'little'), player, target, score, outcome) for x, o, player, target, score, outcome in SAMPLE.iter_unpack(data[CHUNK_HEADER.size:])]
+    return first_game, num_games, samples
+
+def chunk_games(path):
+    """
+    Returns the number of games in the chunk file at the provided path, or 0 if there is no
+    such file.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))[2]
+
+def iter_samples(directory):
+    """
+    Yields the samples (see read_chunk) of every chunk of the dataset in the provided directory,
+    reading one chunk at a time.
+    """
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('chunk-') and name.endswith('.bin'):
+            yield from read_chunk(os.path.join(directory, name))[2]
+
+#################
+### Self-Play ###
+#################
+
+def play_sample_game(x, o, rand, random_plies):
+    """
+    Plays one game between the provided agents, after the provided number of uniformly random
+    opening moves chosen by rand, and returns the packed samples of its positions.
+    """
+    state = BitboardUltimateTicTacToe()
+    positions = []
+    while not state.is_terminal():
+        agent = x if state.to_move() == Player.X else o
+        score = float('nan')
+        if len(positions) < random_plies:
+            action = rand.choice(state.actions())
+        else:
+            action = agent.getAction(state)
+            if agent.stats is not None and agent.stats.score is not None:
+                score = agent.stats.score
+        x_mask, o_mask, target = state.masks()
+        positions.append((x_mask.to_bytes(11, 'little'), o_mask.to_bytes(11, 'little'), state.to_move().value, target, score))
+        x.observeAction(state, action)
+        o.observeAction(state, action)
+        state = state.result(action)
+
+    utility = state.utility()
+    outcome = 1 if utility > 0 else -1 if utility < 0 else 0
+    return [SAMPLE.pack(*position, outcome) for position in positions]
+
+def play_chunk(x_options, o_options, settings, chunk):
+    """
+    Plays the games of the chunk with the provided index and writes their samples to its chunk
+    file, which is replaced atomically so that an interrupted run never leaves a partial chunk.
+    Every game is played by newly loaded agents and seeded by its own index, so that its samples
+    do not depend on the chunks played before it. Returns the index of the chunk, its number of
+    games, and its number of samples.
+    """
+    first_game = chunk * settings['chunk_size']
+    num_games = min(settings['chunk_size'], settings['num_games'] - first_game)
+    path = chunk_path(settings['directory'], chunk)
+    temporary_path = path + '.tmp'
+    num_samples = 0
+    with open(temporary_path, 'wb') as f:
+        f.write(CHUNK_HEADER.pack(CHUNK_MAGIC, first_game, num_games, 0))
+        for index in range(first_game, first_game + num_games):
+            x = load_agent(derive_options(x_options, index))
+            o = load_agent(derive_options(o_options, index))
+            try:
+                samples = play_sample_game(x, o, random.Random(f"{settings['seed']}-{index}"), settings['random_plies'])
+            finally:
+                x.close()
+                o.close()
+            f.write(b''.join(samples))
+            num_samples += len(samples)
+        f.seek(0)
+        f.write(CHUNK_HEADER.pack(CHUNK_MAGIC, first_game, num_games, num_samples))
+    os.replace(temporary_path, path)
+    return chunk, num_games, num_samples
+
+def check_settings(directory, settings):
+    """
+    Records the settings of a run in the provided directory, or, if the directory already holds
+    a dataset, checks that they match its settings, so that a resumed run generates the same
+    games as the interrupted one. The number of games may differ, since every game is seeded by
+    its own index; a run can be extended by resuming it with more games.
+    """
+    settings = {key: value for key, value in settings.items() if key not in ('num_games', 'directory')}
+    path = os.path.join(directory, SETTINGS_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            previous_settings = json.load(f)
+        if previous_settings != settings:
+            raise Exception('The dataset in ' + directory + ' was generated with different settings!')
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(settings, f, indent=4, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def generate_dataset(x_options, o_options, settings, jobs=1):
+    """
+    Plays the games of a dataset, across a pool of processes if more than one job is requested,
+    skipping the chunks that have already been written in full, and yields the result of each chunk
+    (see play_chunk) as it finishes.
+    """
+    if jobs > 1 and (x_options['workers'] > 1 or o_options['workers'] > 1):
+        raise Exception('Agents with worker processes cannot play games in parallel!')
+    directory = settings['directory']
+    check_settings(directory, {'x': x_options, 'o': o_options, **settings})
+
+    chunk_size = settings['chunk_size']
+    num_chunks = (settings['num_games'] + chunk_size - 1) // chunk_size
+    chunks = [chunk for chunk in range(num_chunks) if chunk_games(chunk_path(directory, chunk)) < min(chunk_size, settings['num_games'] - chunk * chunk_size)]
+    play = functools.partial(play_chunk, x_options, o_options, settings)
+
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            yield from pool.imap_unordered(play, chunks)
+    else:
+        yield from map(play, chunks)
+
+def read_command(argv):
+    parser = optparse.OptionParser(description="Generate a dataset of positions of Ultimate Tic-Tac-Toe labeled by search scores and game outcomes, from games between two agents")
+
+    parser.add_option('-f', dest='directory', help='the directory to write the dataset to', default='self_play')
+    parser.add_option('-n', dest='num_games', type='int', help='number of games to play', default=1000)
+    parser.add_option('-c', dest='chunk_size', type='int', help='number of games per chunk file', default=100)
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', help='number of chunks to play in parallel', default=1)
+    parser.add_option('-r', dest='random_plies', type='int', help='number of uniformly random moves that open each game', default=8)
+    parser.add_option('--seed', dest='seed', help='the seed for the random opening moves', default='0')
+    add_agent_options(parser)
+    parser.set_defaults(x_type='MiniMaxAgent', o_type='MiniMaxAgent', x_evaluation_function='deep_simple_evaluation', o_evaluation_function='deep_simple_evaluation')
+
+    options, _ = parser.parse_args(argv)
+    x_options, o_options, settings = split_options(options)
+    jobs = settings.pop('jobs')
+    return x_options, o_options, settings, jobs
+
+if __name__ == '__main__':
+    x_options, o_options, settings, jobs = read_command(sys.argv)
+
+    start = time.perf_counter()
+    total_games = 0
+    total_samples = 0
+    for chunk, num_games, num_samples in generate_dataset(x_options, o_options, settings, jobs):
+        total_games += num_games
+        total_samples += num_samples
+        elapsed = time.perf_counter() - start
+        print(f'Chunk {chunk}: {num_games} games, {num_samples} positions ({total_games / elapsed * 60:.0f} games/min)')
+        sys.stdout.flush()
+    print(f'Played {total_games} games with {total_samples} positions in {time.perf_counter() - start:.1f} seconds')